@@ -2,16 +2,18 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Union
 from datetime import datetime
-from database import get_db_cursor, init_db
+from database import fetch_random_books, get_db_cursor, init_db
 from models import Book, Rating
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import csv
 import json
+import orjson
 from pathlib import Path
 import sqlite3
 import hashlib
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -33,7 +35,7 @@ def clean_csv_value(value):
 def generate_book_id(title: str, author: str) -> str:
     """Generate a stable book ID from title and author."""
     combined = (title + author).encode('utf-8')
-    return hashlib.sha256(combined).hexdigest()[:16]
+    return hashlib.blake2b(combined, digest_size=8).hexdigest()
 
 def import_goodreads_books():
     """Import books from Goodreads CSV export."""
@@ -103,8 +105,8 @@ def import_goodreads_books():
                         # Insert book into database
                         cursor.execute("""
                             INSERT OR REPLACE INTO books 
-                            (id, title, author, description, average_rating, topics, publication_year, page_count)
-                            VALUES (:id, :title, :author, :description, :average_rating, :topics, :publication_year, :page_count)
+                            (id, title, author, description, average_rating, imported_rating, topics, publication_year, page_count)
+                            VALUES (:id, :title, :author, :description, :average_rating, NULLIF(:average_rating, 0), :topics, :publication_year, :page_count)
                         """, book_data)
                         
                         books_added += 1
@@ -219,43 +221,20 @@ async def add_rating(request: RatingRequest):
             if not 1 <= request.rating <= 5:
                 raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
             
-            # Check if rating already exists
-            cursor.execute(
-                "SELECT id FROM ratings WHERE book_id = ?",
-                (request.book_id,)
-            )
-            existing_rating = cursor.fetchone()
-            
-            current_time = datetime.now().isoformat()
-            
-            if existing_rating:
-                # Update existing rating
-                cursor.execute(
-                    "UPDATE ratings SET rating = ?, timestamp = ? WHERE book_id = ?",
-                    (request.rating, current_time, request.book_id)
-                )
-            else:
-                # Add new rating
-                cursor.execute(
-                    "INSERT INTO ratings (book_id, rating, timestamp) VALUES (?, ?, ?)",
-                    (request.book_id, request.rating, current_time)
-                )
+            # Add the rating, or replace the existing one for this book
+            cursor.execute("""
+                INSERT INTO ratings (book_id, rating, timestamp) VALUES (?, ?, ?)
+                ON CONFLICT(book_id) DO UPDATE SET
+                    rating = excluded.rating,
+                    timestamp = excluded.timestamp
+            """, (request.book_id, request.rating, datetime.now().isoformat()))
             
-            # Calculate and update average rating for the book
+            # The ratings triggers keep books.average_rating up to date
             cursor.execute(
-                """
-                SELECT AVG(rating) as avg_rating
-                FROM ratings
-                WHERE book_id = ?
-                """,
+                "SELECT average_rating FROM books WHERE id = ?",
                 (request.book_id,)
             )
-            avg_rating = cursor.fetchone()["avg_rating"]
-            
-            cursor.execute(
-                "UPDATE books SET average_rating = ? WHERE id = ?",
-                (avg_rating or 0, request.book_id)
-            )
+            avg_rating = cursor.fetchone()["average_rating"]
             
             print(f"Successfully rated book {request.book_id} with rating {request.rating}")  # Debug log
             return {
@@ -413,45 +392,28 @@ async def get_recommendations(request: RecommendationRequest):
                 """
                 print(f"Executing query with rated_books: {rated_books}")  # Debug log
                 cursor.execute(query, rated_books)
+                books = cursor.fetchall()
             else:
-                cursor.execute("""
-                    SELECT 
-                        b.id,
-                        b.title,
-                        b.author,
-                        b.description,
-                        b.topics,
-                        b.publication_year,
-                        b.page_count,
-                        COALESCE(AVG(r.rating), 0) as average_rating
-                    FROM books b
-                    LEFT JOIN ratings r ON b.id = r.book_id
-                    GROUP BY b.id
-                    ORDER BY RANDOM()
-                    LIMIT 5
-                """)
+                books = fetch_random_books(cursor)
 
-            books = cursor.fetchall()
             print(f"Found {len(books)} recommendations")  # Debug log
 
             recommendations = []
+            id_updates = []
             for book in books:
                 book_dict = dict(book)
                 
                 # Ensure book has an ID
                 if not book_dict.get('id'):
                     book_id = generate_book_id(book_dict['title'], book_dict['author'])
-                    cursor.execute(
-                        "UPDATE books SET id = ? WHERE title = ? AND author = ?",
-                        (book_id, book_dict['title'], book_dict['author'])
-                    )
+                    id_updates.append((book_id, book_dict['title'], book_dict['author']))
                     book_dict['id'] = book_id
 
                 # Parse topics from JSON string if needed
                 if isinstance(book_dict.get('topics'), str):
                     try:
-                        book_dict['topics'] = json.loads(book_dict['topics'])
-                    except json.JSONDecodeError:
+                        book_dict['topics'] = orjson.loads(book_dict['topics'])
+                    except orjson.JSONDecodeError:
                         book_dict['topics'] = []
                 elif book_dict.get('topics') is None:
                     book_dict['topics'] = []
@@ -468,6 +430,12 @@ async def get_recommendations(request: RecommendationRequest):
                 })
                 print(f"Processed recommendation: {recommendations[-1]}")  # Debug log
 
+            if id_updates:
+                cursor.executemany(
+                    "UPDATE books SET id = ? WHERE title = ? AND author = ?",
+                    id_updates
+                )
+
             return {"recommendations": recommendations}
             
     except Exception as e:
@@ -528,11 +496,10 @@ async def reorder_wishlist(orders: List[dict[str, Union[str, int]]]):
     """Update the display order of wishlist items."""
     try:
         with get_db_cursor() as cursor:
-            for item in orders:
-                cursor.execute(
-                    "UPDATE wishlist SET display_order = ? WHERE book_id = ?",
-                    (item["order"], item["book_id"])
-                )
+            cursor.executemany(
+                "UPDATE wishlist SET display_order = ? WHERE book_id = ?",
+                [(item["order"], item["book_id"]) for item in orders]
+            )
             return {"message": "Wishlist reordered successfully"}
     except Exception as e:
         print(f"Error reordering wishlist: {str(e)}")
@@ -1,18 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Union, Dict
 from datetime import datetime
-from .database import get_db, init_db
+from database import fetch_random_books, get_db, get_ro_db, init_db
 from .models import Book, Rating
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
 import csv
 import json
+import logging
+import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sqlite3
 import hashlib
-from .llm_recommender import get_personalized_recommendations
+from .llm_recommender import GEMINI_MODEL, get_personalized_recommendations
 
-app = FastAPI()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+logger = logging.getLogger("liberopus")
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -34,130 +44,162 @@ def clean_csv_value(value):
 def generate_book_id(title: str, author: str) -> str:
     """Generate a stable book ID from title and author."""
     combined = (title + author).encode('utf-8')
-    return hashlib.sha256(combined).hexdigest()[:16]
+    return hashlib.blake2b(combined, digest_size=8).hexdigest()
+
+# Technical books - focused on programming and technology
+TECHNICAL_KEYWORDS = [
+    'programming', 'python', 'javascript', 'java', 'c++', 'software',
+    'coding', 'development', 'web development', 'data science',
+    'machine learning', 'artificial intelligence', 'computer science',
+    'algorithms', 'database', 'cloud computing', 'devops', 'engineering',
+    'software engineering', 'code', 'git', 'agile', 'react', 'nodejs',
+    'frontend', 'backend', 'full stack', 'api', 'security', 'linux',
+    'operating system', 'network', 'cybersecurity', 'blockchain',
+    'technical', 'technology', 'computer'
+]
+# Single alternation so each row is scanned once by the regex engine
+TECHNICAL_PATTERN = re.compile("|".join(map(re.escape, TECHNICAL_KEYWORDS)))
+
+# Bit in books.topics_mask; NULL means the topics column holds a JSON list
+TOPIC_TECHNICAL = 1
+
+# Rows per executemany batch handed from the CSV reader thread to the writer
+IMPORT_BATCH_SIZE = 10_000
+# Parsed batches allowed to wait for the writer before the reader blocks
+IMPORT_QUEUE_SIZE = 4
+
+def parse_goodreads_row(header: List[str], values: List[str]) -> Optional[Dict]:
+    """Turn one Goodreads CSV record into a row for the books table."""
+    if len(values) < len(header):
+        return None
+        
+    # Create a dictionary of cleaned values
+    row = {header[i]: clean_csv_value(values[i]) for i in range(len(header))}
+    
+    # Skip empty rows
+    if not row.get('Title'):
+        return None
+        
+    # Determine topics based on bookshelves, title, and description.
+    # Keywords never contain a newline, so none can match across fields.
+    haystack = "\n".join((
+        row.get('Bookshelves', ''),
+        row.get('Title', ''),
+        row.get('Description', '')
+    )).lower()
+    
+    # Check if book is technical
+    is_technical = TECHNICAL_PATTERN.search(haystack) is not None
+    topics = ['Technical'] if is_technical else ['Non-Technical']
+    
+    # Clean numeric values
+    try:
+        avg_rating = float(row.get('Average Rating', '0'))
+    except ValueError:
+        avg_rating = 0.0
+        
+    try:
+        pages = int(row.get('Number of Pages', '0'))
+    except ValueError:
+        pages = None
+        
+    try:
+        year = int(row.get('Year Published', '0'))
+    except ValueError:
+        year = None
+    
+    return {
+        'id': generate_book_id(row['Title'], row.get('Author', '')),
+        'title': row['Title'],
+        'author': row.get('Author', 'Unknown'),
+        'description': f"A book by {row.get('Author', 'Unknown')}. Published by {row.get('Publisher', 'Unknown')}.",
+        'average_rating': avg_rating,
+        'topics': json.dumps(topics),
+        'topics_mask': TOPIC_TECHNICAL if is_technical else 0,
+        'publication_year': year,
+        'page_count': pages
+    }
+
+def read_goodreads_batches(csv_path: Path, batches: queue.Queue):
+    """Parse the CSV into batches of book rows and put them on the queue.
+    
+    Runs on a worker thread so parsing overlaps with the database writes.
+    A final ``None`` is always queued to tell the writer the file is done.
+    """
+    try:
+        with open(csv_path, 'r', encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            header = [h.strip() for h in next(reader, [])]
+            logger.debug("CSV Headers: %s", header)
+            
+            batch = []
+            for values in reader:
+                try:
+                    book_data = parse_goodreads_row(header, values)
+                except Exception as e:
+                    logger.warning("Error processing line: %s", e)
+                    continue
+                if book_data is None:
+                    continue
+                batch.append(book_data)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    batches.put(batch)
+                    batch = []
+            if batch:
+                batches.put(batch)
+    finally:
+        batches.put(None)
 
 def import_goodreads_books():
-    """Import books from Goodreads CSV export."""
+    """Import books from Goodreads CSV export.
+    
+    Blocking; call it through ``asyncio.to_thread`` from async code.
+    """
     try:
         csv_path = Path("goodreads_library_export.csv")
         if not csv_path.exists():
-            print(f"CSV file not found at {csv_path.absolute()}")
+            logger.warning("CSV file not found at %s", csv_path.absolute())
             return
         
-        print(f"Starting Goodreads import from {csv_path.absolute()}")
+        logger.info("Starting Goodreads import from %s", csv_path.absolute())
         
-        with get_db() as db:
-            # Clear existing books
-            db.execute("DELETE FROM books")
-            db.execute("DELETE FROM ratings")
-            db.commit()
-            
-            # Read CSV file
-            with open(csv_path, 'r', encoding='utf-8') as file:
-                # Read header and clean it
-                header = file.readline().strip().split(',')
-                header = [h.strip() for h in header]
-                print(f"CSV Headers: {header}")
-                
-                books_added = 0
-                for line in file:
-                    try:
-                        # Split the line and clean values
-                        values = line.strip().split(',')
-                        if len(values) < len(header):
-                            continue
-                            
-                        # Create a dictionary of cleaned values
-                        row = {header[i]: clean_csv_value(values[i]) for i in range(len(header))}
-                        
-                        # Skip empty rows
-                        if not row.get('Title'):
-                            continue
-                            
-                        # Determine topics based on bookshelves, title, and description
-                        bookshelves = row.get('Bookshelves', '').lower()
-                        title = row.get('Title', '').lower()
-                        description = row.get('Description', '').lower()
-                        topics = []
-                        
-                        # Technical books - focused on programming and technology
-                        technical_keywords = [
-                            'programming', 'python', 'javascript', 'java', 'c++', 'software',
-                            'coding', 'development', 'web development', 'data science',
-                            'machine learning', 'artificial intelligence', 'computer science',
-                            'algorithms', 'database', 'cloud computing', 'devops', 'engineering',
-                            'software engineering', 'code', 'git', 'agile', 'react', 'nodejs',
-                            'frontend', 'backend', 'full stack', 'api', 'security', 'linux',
-                            'operating system', 'network', 'cybersecurity', 'blockchain',
-                            'technical', 'technology', 'computer'
-                        ]
-                        
-                        # Check if book is technical
-                        is_technical = any(
-                            keyword in bookshelves or keyword in title or keyword in description
-                            for keyword in technical_keywords
-                        )
-                        
-                        if is_technical:
-                            topics.append('Technical')
-                        else:
-                            topics.append('Non-Technical')
-                        
-                        # Clean numeric values
-                        try:
-                            avg_rating = float(clean_csv_value(row.get('Average Rating', '0')))
-                        except ValueError:
-                            avg_rating = 0.0
-                            
-                        try:
-                            pages = int(clean_csv_value(row.get('Number of Pages', '0')))
-                        except ValueError:
-                            pages = None
-                            
-                        try:
-                            year = int(clean_csv_value(row.get('Year Published', '0')))
-                        except ValueError:
-                            year = None
-                        
-                        # Prepare book data
-                        book_data = {
-                            'id': generate_book_id(row['Title'], row.get('Author', '')),
-                            'title': row['Title'],
-                            'author': row.get('Author', 'Unknown'),
-                            'description': f"A book by {row.get('Author', 'Unknown')}. Published by {row.get('Publisher', 'Unknown')}.",
-                            'average_rating': avg_rating,
-                            'topics': json.dumps(topics),
-                            'publication_year': year,
-                            'page_count': pages
-                        }
-                        
-                        # Insert book into database
-                        cursor = db.execute("""
+        batches = queue.Queue(maxsize=IMPORT_QUEUE_SIZE)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            reader = executor.submit(read_goodreads_batches, csv_path, batches)
+            batch = []
+            try:
+                with get_db() as db:
+                    # Clear existing books
+                    db.execute("DELETE FROM books")
+                    db.execute("DELETE FROM ratings")
+                    
+                    books_added = 0
+                    while (batch := batches.get()) is not None:
+                        db.executemany("""
                             INSERT OR REPLACE INTO books 
-                            (id, title, author, description, average_rating, topics, publication_year, page_count)
-                            VALUES (:id, :title, :author, :description, :average_rating, :topics, :publication_year, :page_count)
-                        """, book_data)
-                        
-                        books_added += 1
-                        if books_added % 10 == 0:
-                            print(f"Added {books_added} books...")
-                            
-                    except Exception as e:
-                        print(f"Error processing line: {str(e)}")
-                        continue
-                
-                db.commit()
-                print(f"Successfully imported {books_added} books from Goodreads")
+                            (id, title, author, description, average_rating, imported_rating, topics, topics_mask, publication_year, page_count)
+                            VALUES (:id, :title, :author, :description, :average_rating, NULLIF(:average_rating, 0), :topics, :topics_mask, :publication_year, :page_count)
+                        """, batch)
+                        books_added += len(batch)
+                        logger.debug("Added %d books...", books_added)
+                    
+                    db.commit()
+            finally:
+                # Unblock the reader if the writer stopped early
+                while batch is not None:
+                    batch = batches.get()
+            reader.result()
+            logger.info("Successfully imported %d books from Goodreads", books_added)
                 
     except Exception as e:
-        print(f"Error importing books from Goodreads: {str(e)}")
+        logger.error("Error importing books from Goodreads: %s", e)
         raise
 
 # Initialize database and import books on startup
 @app.on_event("startup")
 async def startup_event():
     init_db()
-    import_goodreads_books()
+    await asyncio.to_thread(import_goodreads_books)
 
 class Book(BaseModel):
     id: str
@@ -170,9 +212,14 @@ class Book(BaseModel):
     page_count: Optional[int] = None
 
 def convert_db_book_to_model(row: sqlite3.Row) -> Book:
-    # Convert topics from JSON string to list
-    topics = json.loads(row['topics']) if row['topics'] else []
-    return Book(
+    topics_mask = row['topics_mask']
+    if topics_mask is not None:
+        topics = ['Technical'] if topics_mask & TOPIC_TECHNICAL else ['Non-Technical']
+    else:
+        # Convert topics from JSON string to list
+        topics = json.loads(row['topics']) if row['topics'] else []
+    # Rows come from our own schema, so skip pydantic validation
+    return Book.model_construct(
         id=row['id'],
         title=row['title'],
         author=row['author'],
@@ -187,11 +234,26 @@ def convert_db_book_to_model(row: sqlite3.Row) -> Book:
 async def root():
     return {"message": "Book Recommender API is running"}
 
+@app.get("/healthz")
+async def healthz():
+    """Report database reachability and whether Gemini is configured.
+    
+    Does not call Gemini, so it is cheap enough for liveness probes; bad
+    credentials show up on the first recommendation request instead.
+    """
+    try:
+        with get_ro_db() as db:
+            db.execute("SELECT 1").fetchone()
+    except Exception as e:
+        logger.error("Health check failed: %s", e)
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ok", "gemini_configured": GEMINI_MODEL is not None}
+
 @app.get("/books")
 async def get_books():
     """Get all books from the database."""
     try:
-        with get_db() as db:
+        with get_ro_db() as db:
             cursor = db.execute("""
                 SELECT b.*, 
                        COUNT(r.id) as rating_count
@@ -201,22 +263,21 @@ async def get_books():
                 ORDER BY b.title
             """)
             books = cursor.fetchall()
-            print(f"Found {len(books)} books in database")  # Debug log
+            logger.debug("Found %d books in database", len(books))
             
             book_list = []
             for book in books:
                 try:
-                    print(f"Processing book: id={book['id']}, title={book['title']}")  # Debug log
                     book_model = convert_db_book_to_model(book)
                     book_list.append(book_model)
                 except Exception as book_error:
-                    print(f"Error converting book {book['id']}: {str(book_error)}")
+                    logger.warning("Error converting book %s: %s", book['id'], book_error)
                     continue
             
             return book_list
             
     except Exception as e:
-        print(f"Error in get_books: {str(e)}")
+        logger.error("Error in get_books: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to load books: {str(e)}"
@@ -232,33 +293,59 @@ class AddBookRequest(BaseModel):
     publication_year: Optional[int] = None
 
 @app.post("/add-book")
+@app.post("/books")
 async def add_book(book_data: AddBookRequest):
-    """Add a new book to the database."""
+    """Add a new book to the database.
+    
+    Served at both /add-book and /books. The ID is derived from title and
+    author, so the same book keeps the same ID across restarts.
+    """
     try:
+        book_id = generate_book_id(book_data.title, book_data.author)
         with get_db() as db:
-            cursor = db.execute("""
+            # Check if book already exists, ignoring case like idx_books_title_author_nocase
+            cursor = db.execute(
+                "SELECT id FROM books WHERE id = ? OR (LOWER(title) = LOWER(?) AND LOWER(author) = LOWER(?))",
+                (book_id, book_data.title, book_data.author)
+            )
+            if cursor.fetchone():
+                raise HTTPException(status_code=400, detail="Book already exists")
+            
+            db.execute("""
                 INSERT INTO books (
-                    title, author, description, technical_level, 
-                    page_count, publication_year
-                ) VALUES (?, ?, ?, ?, ?, ?)
+                    id, title, author, description, average_rating, topics,
+                    topics_mask, technical_level, publication_year, page_count
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
+                    book_id,
                     book_data.title,
                     book_data.author,
-                    book_data.description,
+                    book_data.description or "Added by user",
+                    0.0,
+                    json.dumps(["Non-Technical"]),  # Default topic
+                    0,
                     book_data.technical_level,
-                    book_data.page_count,
-                    book_data.publication_year
+                    book_data.publication_year or datetime.now().year,
+                    book_data.page_count or 0
                 ))
             db.commit()
             
             # Get the inserted book
-            book_id = cursor.lastrowid
             cursor = db.execute("SELECT * FROM books WHERE id = ?", (book_id,))
             book = cursor.fetchone()
             
-            return {"message": "Book added successfully", "book": convert_db_book_to_model(book)}
+            return {
+                "message": "Book added successfully",
+                "book_id": book_id,
+                "book": convert_db_book_to_model(book)
+            }
+    except HTTPException:
+        raise
+    except sqlite3.IntegrityError:
+        # Added concurrently between the check and the insert
+        raise HTTPException(status_code=400, detail="Book already exists")
     except Exception as e:
-        print(f"Error adding book: {str(e)}")
+        logger.error("Error adding book: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 class RatingRequest(BaseModel):
@@ -270,45 +357,40 @@ class RatingRequest(BaseModel):
 async def submit_rating(request: RatingRequest):
     """Submit a rating for a book."""
     try:
-        print(f"Received rating request: book_id={request.book_id}, rating={request.rating}")  # Debug log
+        logger.debug("Received rating request: book_id=%s, rating=%s", request.book_id, request.rating)
+        
+        # Check if rating is valid (1-5)
+        if not 1 <= request.rating <= 5:
+            raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
+        
         with get_db() as db:
-            # Check if book exists
-            cursor = db.execute("SELECT id, title FROM books WHERE id = ?", (request.book_id,))
-            book = cursor.fetchone()
-            if not book:
-                print(f"Book not found with ID: {request.book_id}")  # Debug log
-                # List some valid book IDs for comparison
-                cursor = db.execute("SELECT id, title FROM books LIMIT 5")
-                sample_books = cursor.fetchall()
-                print("Sample valid book IDs:")
-                for b in sample_books:
-                    print(f"  {b['id']} - {b['title']}")
+            # Add or update rating, only if the book exists
+            cursor = db.execute("""
+                INSERT INTO ratings (book_id, rating, timestamp)
+                SELECT ?, ?, ?
+                WHERE EXISTS (SELECT 1 FROM books WHERE id = ?)
+                ON CONFLICT(book_id) DO UPDATE SET
+                    rating = excluded.rating,
+                    timestamp = excluded.timestamp
+            """, (request.book_id, request.rating, datetime.now().isoformat(), request.book_id))
+            if cursor.rowcount == 0:
+                logger.debug("Book not found with ID: %s", request.book_id)
                 raise HTTPException(status_code=404, detail="Book not found")
             
-            print(f"Found book: id={book['id']}, title={book['title']}")  # Debug log
-            
-            # Check if rating is valid (1-5)
-            if not 1 <= request.rating <= 5:
-                raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
-            
-            # Add or update rating
-            db.execute("""
-                INSERT OR REPLACE INTO ratings (book_id, rating, timestamp)
-                VALUES (?, ?, ?)
-            """, (request.book_id, request.rating, datetime.now().isoformat()))
-            
             db.commit()
-            print(f"Successfully submitted rating for book: {book['title']}")  # Debug log
+            logger.debug("Successfully submitted rating for book: %s", request.book_id)
             return {"message": "Rating submitted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error submitting rating: {str(e)}")
+        logger.error("Error submitting rating: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/ratings")
 async def get_ratings():
     """Get all ratings from the database."""
     try:
-        with get_db() as db:
+        with get_ro_db() as db:
             cursor = db.execute("SELECT * FROM ratings")
             ratings = cursor.fetchall()
             return {
@@ -323,14 +405,14 @@ async def get_ratings():
                 ]
             }
     except Exception as e:
-        print(f"Error getting ratings: {str(e)}")
+        logger.error("Error getting ratings: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/import-goodreads")
 async def import_goodreads():
     """Manually trigger Goodreads import."""
     try:
-        import_goodreads_books()
+        await asyncio.to_thread(import_goodreads_books)
         return {"message": "Goodreads import completed successfully"}
     except Exception as e:
         raise HTTPException(
@@ -398,42 +480,46 @@ async def dismiss_book(request: DismissBookRequest):
     """Add a book to the dismissed list."""
     try:
         with get_db() as db:
-            # Check if book exists
-            cursor = db.execute("SELECT id FROM books WHERE id = ?", (request.book_id,))
-            if not cursor.fetchone():
+            # Add to dismissed books, only if the book exists
+            cursor = db.execute("""
+                INSERT INTO dismissed_books (book_id, timestamp)
+                SELECT ?, ?
+                WHERE EXISTS (SELECT 1 FROM books WHERE id = ?)
+            """, (request.book_id, datetime.now().isoformat(), request.book_id))
+            if cursor.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Book not found")
-            
-            # Add to dismissed books
-            db.execute(
-                "INSERT INTO dismissed_books (book_id, timestamp) VALUES (?, ?)",
-                (request.book_id, datetime.now().isoformat())
-            )
             db.commit()
             return {"message": "Book dismissed successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error dismissing book: {str(e)}")
+        logger.error("Error dismissing book: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/dismissed-books")
 async def get_dismissed_books():
     """Get list of dismissed book IDs."""
     try:
-        with get_db() as db:
+        with get_ro_db() as db:
             cursor = db.execute("SELECT book_id FROM dismissed_books")
             dismissed = cursor.fetchall()
             return {"dismissed_books": [row["book_id"] for row in dismissed]}
     except Exception as e:
-        print(f"Error getting dismissed books: {str(e)}")
+        logger.error("Error getting dismissed books: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/get-recommendations")
-async def get_recommendations(data: dict):
-    """Get personalized book recommendations based on user history and ratings."""
+async def get_recommendations(data: dict, background_tasks: BackgroundTasks):
+    """Get personalized book recommendations based on user history and ratings.
+    
+    Serves the last cached Gemini recommendations immediately and refreshes
+    them in the background once they expire.
+    """
     try:
         user_history = data.get("user_history", [])
         user_ratings = data.get("user_ratings", {})
         
-        print(f"Received request - User history: {user_history}, User ratings: {user_ratings}")
+        logger.debug("Received request - User history: %s, User ratings: %s", user_history, user_ratings)
         
         # Get book details for the rated books
         with get_db() as db:
@@ -457,20 +543,11 @@ async def get_recommendations(data: dict):
                     WHERE b.id IN ({placeholders})
                     GROUP BY b.id
                 """
-                cursor = db.execute(query, user_history)
+                books = db.execute(query, user_history).fetchall()
             else:
                 # If no user history, get random books for default recommendations
-                cursor = db.execute("""
-                    SELECT b.id, b.title, b.author, b.description, b.topics, b.publication_year, b.page_count,
-                           COALESCE(AVG(r.rating), 0) as average_rating
-                    FROM books b
-                    LEFT JOIN ratings r ON b.id = r.book_id
-                    GROUP BY b.id
-                    ORDER BY RANDOM()
-                    LIMIT 5
-                """)
+                books = fetch_random_books(db)
             
-            books = cursor.fetchall()
             book_history = []
             for book in books:
                 book_dict = dict(book)
@@ -488,24 +565,16 @@ async def get_recommendations(data: dict):
         recommendations = await get_personalized_recommendations(
             user_history=book_history,
             user_ratings=user_ratings,
-            num_recommendations=5
+            num_recommendations=5,
+            schedule_refresh=background_tasks.add_task
         )
         
-        print("Generated recommendations:", recommendations)
+        logger.debug("Generated recommendations: %s", recommendations)
         
         if not recommendations:
             # If no recommendations, return random books
             with get_db() as db:
-                cursor = db.execute("""
-                    SELECT b.id, b.title, b.author, b.description, b.topics, b.publication_year, b.page_count,
-                           COALESCE(AVG(r.rating), 0) as average_rating
-                    FROM books b
-                    LEFT JOIN ratings r ON b.id = r.book_id
-                    GROUP BY b.id
-                    ORDER BY RANDOM()
-                    LIMIT 5
-                """)
-                default_books = cursor.fetchall()
+                default_books = fetch_random_books(db)
                 recommendations = []
                 for book in default_books:
                     book_dict = dict(book)
@@ -525,7 +594,7 @@ async def get_recommendations(data: dict):
         }
         
     except Exception as e:
-        print(f"Error in get_recommendations: {str(e)}")
+        logger.error("Error in get_recommendations: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get recommendations: {str(e)}"
@@ -535,7 +604,7 @@ async def get_recommendations(data: dict):
 async def get_wishlist():
     """Get all books in the wishlist."""
     try:
-        with get_db() as db:
+        with get_ro_db() as db:
             cursor = db.execute("""
                 SELECT b.*, w.notes, w.timestamp, w.display_order
                 FROM books b
@@ -556,7 +625,7 @@ async def get_wishlist():
                 ]
             }
     except Exception as e:
-        print(f"Error getting wishlist: {str(e)}")
+        logger.error("Error getting wishlist: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/wishlist/add")
@@ -564,57 +633,52 @@ async def add_to_wishlist(request: WishlistRequest):
     """Add a book to the wishlist."""
     try:
         with get_db() as db:
-            # Check if book exists
-            cursor = db.execute("SELECT id FROM books WHERE id = ?", (request.book_id,))
-            if not cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Book not found")
-            
             # Check if book is already in wishlist
             cursor = db.execute("SELECT id FROM wishlists WHERE book_id = ?", (request.book_id,))
             if cursor.fetchone():
                 raise HTTPException(status_code=400, detail="Book already in wishlist")
             
-            # Get max display order
-            cursor = db.execute("SELECT MAX(display_order) as max_order FROM wishlists")
-            result = cursor.fetchone()
-            next_order = (result["max_order"] or 0) + 1
-            
-            # Add to wishlist
-            db.execute(
-                "INSERT INTO wishlists (book_id, notes, timestamp, display_order) VALUES (?, ?, ?, ?)",
-                (request.book_id, request.notes, datetime.now().isoformat(), next_order)
-            )
+            # Add to the end of the wishlist, only if the book exists
+            cursor = db.execute("""
+                INSERT INTO wishlists (book_id, notes, timestamp, display_order)
+                SELECT ?, ?, ?, (SELECT COALESCE(MAX(display_order), 0) + 1 FROM wishlists)
+                WHERE EXISTS (SELECT 1 FROM books WHERE id = ?)
+            """, (request.book_id, request.notes, datetime.now().isoformat(), request.book_id))
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Book not found")
             db.commit()
             return {"message": "Book added to wishlist successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error adding to wishlist: {str(e)}")
+        logger.error("Error adding to wishlist: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/wishlist/remove/{book_id}")
 async def remove_from_wishlist(book_id: str):
     """Remove a book from the wishlist."""
     try:
-        print(f"Attempting to remove book {book_id} from wishlist")  # Debug log
+        logger.debug("Attempting to remove book %s from wishlist", book_id)
         with get_db() as db:
             # First check if the book is in the wishlist
             cursor = db.execute("SELECT book_id FROM wishlists WHERE book_id = ?", (book_id,))
             if not cursor.fetchone():
-                print(f"Book {book_id} not found in wishlist")  # Debug log
+                logger.debug("Book %s not found in wishlist", book_id)
                 raise HTTPException(status_code=404, detail="Book not found in wishlist")
             
             # Remove from wishlist
             cursor = db.execute("DELETE FROM wishlists WHERE book_id = ?", (book_id,))
-            print(f"Deleted {cursor.rowcount} rows from wishlist")  # Debug log
+            logger.debug("Deleted %d rows from wishlist", cursor.rowcount)
             
             if cursor.rowcount == 0:
-                print(f"No rows were deleted for book {book_id}")  # Debug log
+                logger.debug("No rows were deleted for book %s", book_id)
                 raise HTTPException(status_code=404, detail="Book not found in wishlist")
             
             db.commit()
-            print(f"Successfully removed book {book_id} from wishlist")  # Debug log
+            logger.debug("Successfully removed book %s from wishlist", book_id)
             return {"message": "Book removed from wishlist successfully"}
     except Exception as e:
-        print(f"Error removing book {book_id} from wishlist: {str(e)}")  # Debug log
+        logger.error("Error removing book %s from wishlist: %s", book_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/wishlist/reorder")
@@ -622,47 +686,12 @@ async def reorder_wishlist(orders: List[dict[str, Union[str, int]]]):
     """Update the display order of wishlist items."""
     try:
         with get_db() as db:
-            for item in orders:
-                db.execute(
-                    "UPDATE wishlists SET display_order = ? WHERE book_id = ?",
-                    (item["order"], item["book_id"])
-                )
+            db.executemany(
+                "UPDATE wishlists SET display_order = ? WHERE book_id = ?",
+                [(item["order"], item["book_id"]) for item in orders]
+            )
             db.commit()
             return {"message": "Wishlist reordered successfully"}
     except Exception as e:
-        print(f"Error reordering wishlist: {str(e)}")
+        logger.error("Error reordering wishlist: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/books")
-async def add_book(book: AddBookRequest):
-    """Add a new book to the database."""
-    try:
-        with get_db() as db:
-            # Generate book ID from title and author
-            book_id = str(hash(f"{book.title}{book.author}"))
-
-            # Check if book already exists
-            cursor = db.execute("SELECT id FROM books WHERE id = ?", (book_id,))
-            if cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Book already exists")
-
-            # Insert new book with default values
-            cursor.execute("""
-                INSERT INTO books (id, title, author, description, average_rating, topics, publication_year, page_count)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                book_id,
-                book.title,
-                book.author,
-                "Added by user",  # Default description
-                0.0,  # Default rating
-                json.dumps(["Non-Technical"]),  # Default topic
-                datetime.now().year,  # Current year
-                0  # Default page count
-            ))
-            
-            db.commit()
-            return {"message": "Book added successfully", "book_id": book_id}
-    except Exception as e:
-        print(f"Error adding book: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
@@ -1,176 +1,376 @@
 import os
 import google.generativeai as genai
-from typing import List, Dict
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import hashlib
 import json
+import logging
+import orjson
 import random
 import asyncio
+import time
+from aiolimiter import AsyncLimiter
+from google.api_core.exceptions import ResourceExhausted
 from tenacity import retry, stop_after_attempt, wait_exponential
-from database import get_db
+from database import get_db, get_db_cursor
+
+logger = logging.getLogger("liberopus")
 
 # Load environment variables
 load_dotenv()
 
 # Get API key
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-print(f"API Key loaded: {'Yes' if GOOGLE_API_KEY else 'No'}")
-print(f"API Key length: {len(GOOGLE_API_KEY) if GOOGLE_API_KEY else 0}")
+logger.debug("API Key loaded: %s", 'Yes' if GOOGLE_API_KEY else 'No')
 
-# Configure Google Generative AI if API key is available
+# Configure Google Generative AI if API key is available. The model is
+# created once and shared so its client and connection are reused.
+GEMINI_MODEL = None
 if GOOGLE_API_KEY:
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        # Test the configuration
-        model = genai.GenerativeModel("gemini-pro")
-        response = model.generate_content("Test connection")
-        print("Gemini API connection successful")
+        genai.configure(api_key=GOOGLE_API_KEY, transport="grpc")
+        GEMINI_MODEL = genai.GenerativeModel("gemini-pro")
+        logger.info("Gemini API configured")
     except Exception as e:
-        print(f"Error configuring Gemini API: {str(e)}")
+        logger.error("Error configuring Gemini API: %s", e)
 else:
-    print("Warning: GOOGLE_API_KEY not found in environment variables")
+    logger.warning("GOOGLE_API_KEY not found in environment variables")
 
 def generate_book_id(title: str, author: str) -> str:
     """Generate a stable book ID from title and author."""
     combined = (title + author).encode('utf-8')
-    return hashlib.sha256(combined).hexdigest()[:16]
+    return hashlib.blake2b(combined, digest_size=8).hexdigest()
+
+# Gemini responses are reused for a day, from memory first and then from the DB
+GEMINI_CACHE_TTL = 86400
+GEMINI_CACHE_SIZE = 1024
+_gemini_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def recommendation_cache_key(book_history: List[Dict], num_recommendations: int) -> str:
+    """Hash the rated books and request size into an order-independent cache key."""
+    books = sorted(json.dumps(book, sort_keys=True) for book in book_history)
+    combined = json.dumps([books, num_recommendations]).encode('utf-8')
+    return hashlib.sha256(combined).hexdigest()
+
+def _remember_recommendations(key: str, recommendations: List[Dict], ts: float):
+    """Store recommendations in the in-process LRU, evicting the oldest entry."""
+    _gemini_cache[key] = (ts, recommendations)
+    _gemini_cache.move_to_end(key)
+    if len(_gemini_cache) > GEMINI_CACHE_SIZE:
+        _gemini_cache.popitem(last=False)
+
+def lookup_cached_recommendations(key: str) -> Optional[Tuple[float, List[Dict]]]:
+    """Return the (timestamp, recommendations) cached for the key, however old."""
+    entry = _gemini_cache.get(key)
+    if entry:
+        _gemini_cache.move_to_end(key)
+        return entry
+    
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT response, ts FROM gemini_cache WHERE key = ?", (key,))
+        row = cursor.fetchone()
+    if row:
+        recommendations = orjson.loads(row['response'])
+        _remember_recommendations(key, recommendations, row['ts'])
+        return row['ts'], recommendations
+    return None
+
+def get_cached_recommendations(key: str) -> Optional[List[Dict]]:
+    """Return unexpired cached recommendations for the key, or None."""
+    entry = lookup_cached_recommendations(key)
+    if entry and time.time() - entry[0] < GEMINI_CACHE_TTL:
+        return entry[1]
+    return None
+
+def cache_recommendations(key: str, recommendations: List[Dict]):
+    """Write parsed Gemini recommendations through to memory and the DB."""
+    now = int(time.time())
+    _remember_recommendations(key, recommendations, now)
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO gemini_cache (key, response, ts) VALUES (?, ?, ?)",
+            (key, json.dumps(recommendations), now)
+        )
 
 def format_book_history(books: List[Dict]) -> str:
     """Format book history into a readable string for the LLM."""
-    formatted_text = "Books rated by the user:\n\n"
-    for book in books:
-        formatted_text += f"Title: {book['title']}\n"
-        formatted_text += f"Author: {book['author']}\n"
-        formatted_text += f"Rating: {book.get('rating', 0)}/5\n"
-        formatted_text += f"Topics: {', '.join(book.get('topics', []))}\n\n"
-    return formatted_text
+    key = tuple(
+        (book['title'], book['author'], book.get('rating', 0), tuple(book.get('topics', [])))
+        for book in books
+    )
+    return _format_book_history(key)
+
+@functools.lru_cache(maxsize=256)
+def _format_book_history(books: tuple) -> str:
+    """Build the history text from hashable (title, author, rating, topics) tuples."""
+    parts = ["Books rated by the user:\n\n"]
+    for title, author, rating, topics in books:
+        parts.append(
+            f"Title: {title}\n"
+            f"Author: {author}\n"
+            f"Rating: {rating}/5\n"
+            f"Topics: {', '.join(topics)}\n\n"
+        )
+    return "".join(parts)
+
+# Static fallback picks; get_fallback_recommendations hands out copies
+FALLBACK_BOOKS = [
+    {
+        "title": "Clean Code",
+        "author": "Robert C. Martin",
+        "explanation": "A fundamental guide to writing maintainable code",
+        "technical_level": "Intermediate",
+        "topics": ["Software Engineering", "Best Practices"]
+    },
+    {
+        "title": "Design Patterns",
+        "author": "Erich Gamma et al.",
+        "explanation": "Essential patterns for software design",
+        "technical_level": "Advanced",
+        "topics": ["Software Design", "Architecture"]
+    },
+    {
+        "title": "Python Crash Course",
+        "author": "Eric Matthes",
+        "explanation": "Comprehensive introduction to Python programming",
+        "technical_level": "Beginner",
+        "topics": ["Python", "Programming"]
+    },
+    {
+        "title": "The Pragmatic Programmer",
+        "author": "Andrew Hunt and David Thomas",
+        "explanation": "Practical advice for software development",
+        "technical_level": "Intermediate",
+        "topics": ["Software Development", "Best Practices"]
+    },
+    {
+        "title": "JavaScript: The Good Parts",
+        "author": "Douglas Crockford",
+        "explanation": "Focus on the best features of JavaScript",
+        "technical_level": "Intermediate",
+        "topics": ["JavaScript", "Web Development"]
+    }
+]
 
 def get_fallback_recommendations() -> List[Dict]:
     """Return a list of fallback recommendations when Gemini is not available."""
-    fallback_books = [
-        {
-            "title": "Clean Code",
-            "author": "Robert C. Martin",
-            "explanation": "A fundamental guide to writing maintainable code",
-            "technical_level": "Intermediate",
-            "topics": ["Software Engineering", "Best Practices"]
-        },
-        {
-            "title": "Design Patterns",
-            "author": "Erich Gamma et al.",
-            "explanation": "Essential patterns for software design",
-            "technical_level": "Advanced",
-            "topics": ["Software Design", "Architecture"]
-        },
-        {
-            "title": "Python Crash Course",
-            "author": "Eric Matthes",
-            "explanation": "Comprehensive introduction to Python programming",
-            "technical_level": "Beginner",
-            "topics": ["Python", "Programming"]
-        },
-        {
-            "title": "The Pragmatic Programmer",
-            "author": "Andrew Hunt and David Thomas",
-            "explanation": "Practical advice for software development",
-            "technical_level": "Intermediate",
-            "topics": ["Software Development", "Best Practices"]
-        },
-        {
-            "title": "JavaScript: The Good Parts",
-            "author": "Douglas Crockford",
-            "explanation": "Focus on the best features of JavaScript",
-            "technical_level": "Intermediate",
-            "topics": ["JavaScript", "Web Development"]
-        }
+    return [
+        {**book, "topics": list(book["topics"])}
+        for book in random.sample(FALLBACK_BOOKS, min(5, len(FALLBACK_BOOKS)))
+    ]
+
+def parse_streamed_json(chunks: Iterable[str]):
+    """Accumulate streamed text and parse it as JSON once it looks complete.
+    
+    A parse is only attempted when a chunk ends in '}' or ']', so a long reply
+    is not re-parsed after every chunk. Raises JSONDecodeError, with the full
+    text in `doc`, if the finished stream is not valid JSON.
+    """
+    parts = []
+    for text in chunks:
+        parts.append(text)
+        if text.rstrip().endswith(('}', ']')):
+            try:
+                return orjson.loads("".join(parts))
+            except orjson.JSONDecodeError:
+                continue
+    return orjson.loads("".join(parts))
+
+def generate_json(prompt: str):
+    """Stream a Gemini reply for the prompt and parse it as JSON. Blocking."""
+    response = GEMINI_MODEL.generate_content(prompt, stream=True)
+    return parse_streamed_json(chunk.text for chunk in response)
+
+# Rated books are split into at most this many topic groups, one prompt each
+GEMINI_MAX_PROMPTS = 3
+# Upper bound on Gemini requests in flight from this process
+GEMINI_MAX_CONCURRENCY = 8
+_gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+# Dedicated, long-lived workers for the blocking Gemini client so calls reuse
+# threads (and the client's gRPC channel) instead of the default executor
+_gemini_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+# Requests are paced below the per-minute quota instead of backing off on 429s
+GEMINI_REQUESTS_PER_MINUTE = 500
+_gemini_limiter = AsyncLimiter(GEMINI_REQUESTS_PER_MINUTE, 60)
+
+# Static prompt text; only the history and the count are filled in per call
+PROMPT_TEMPLATE = """Based on the user's book ratings and preferences below, recommend {n} technical books. 
+    Focus on books that match their interests and technical level.
+    For each recommendation, provide:
+    1. Title
+    2. Author
+    3. Brief explanation of why it matches their interests
+    4. Technical level (Beginner/Intermediate/Advanced)
+    5. Main topics covered
+
+    Format each recommendation in JSON structure.
+    
+    User's reading history:
+    {history}
+    
+    Provide recommendations in the following format:
+    [
+        {{
+            "title": "Book Title",
+            "author": "Author Name",
+            "explanation": "Why this book matches their interests",
+            "technical_level": "Beginner/Intermediate/Advanced",
+            "topics": ["Topic1", "Topic2"]
+        }}
     ]
-    return random.sample(fallback_books, min(5, len(fallback_books)))
+    """
+
+def split_book_history(book_history: List[Dict], max_groups: int = GEMINI_MAX_PROMPTS) -> List[List[Dict]]:
+    """Group rated books by their main topic, best-rated groups first.
+    
+    Books outside the top `max_groups` groups are folded into the last one
+    so every rating still reaches a prompt.
+    """
+    groups: Dict[str, List[Dict]] = {}
+    for book in book_history:
+        topics = book.get('topics') or ['General']
+        groups.setdefault(topics[0], []).append(book)
+    
+    ranked = sorted(
+        groups.values(),
+        key=lambda books: sum(b.get('rating', 0) for b in books) / len(books),
+        reverse=True
+    )
+    if len(ranked) > max_groups:
+        ranked[max_groups - 1] = [b for books in ranked[max_groups - 1:] for b in books]
+        ranked = ranked[:max_groups]
+    return ranked
+
+async def request_gemini_recommendations(book_history: List[Dict], num_recommendations: int) -> List[Dict]:
+    """Send one recommendation prompt to Gemini and parse the JSON reply."""
+    # Format the book history
+    history_text = format_book_history(book_history)
+    
+    # Create the prompt
+    prompt = PROMPT_TEMPLATE.format(n=num_recommendations, history=history_text)
+
+    logger.debug("Sending prompt to Gemini: %s", prompt)
+    
+    # Generate recommendations using Gemini with timeout
+    try:
+        async with _gemini_limiter, _gemini_semaphore:
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(_gemini_executor, generate_json, prompt),
+                timeout=15  # 15 seconds timeout
+            )
+    except orjson.JSONDecodeError as e:
+        logger.warning("Raw response that failed to parse: %s", e.doc)
+        raise
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 async def generate_gemini_recommendations(book_history: List[Dict], num_recommendations: int = 5) -> List[Dict]:
-    """Generate book recommendations using Gemini Pro with retries."""
+    """Generate book recommendations using Gemini Pro with retries.
+    
+    The rated books are split by topic and the prompts are sent
+    concurrently; results are merged and deduplicated by book ID.
+    """
     try:
-        if not GOOGLE_API_KEY:
-            print("No Google API key available, using fallback recommendations")
+        if GEMINI_MODEL is None:
+            logger.debug("Gemini is not configured, using fallback recommendations")
             return get_fallback_recommendations()
 
-        # Format the book history
-        history_text = format_book_history(book_history)
-        print(f"Formatted history text: {history_text}")  # Debug log
-        
-        # Create the prompt
-        prompt = f"""Based on the user's book ratings and preferences below, recommend {num_recommendations} technical books. 
-        Focus on books that match their interests and technical level.
-        For each recommendation, provide:
-        1. Title
-        2. Author
-        3. Brief explanation of why it matches their interests
-        4. Technical level (Beginner/Intermediate/Advanced)
-        5. Main topics covered
+        cache_key = recommendation_cache_key(book_history, num_recommendations)
+        cached = get_cached_recommendations(cache_key)
+        if cached is not None:
+            return cached
 
-        Format each recommendation in JSON structure.
-        
-        User's reading history:
-        {history_text}
-        
-        Provide recommendations in the following format:
-        [
-            {{
-                "title": "Book Title",
-                "author": "Author Name",
-                "explanation": "Why this book matches their interests",
-                "technical_level": "Beginner/Intermediate/Advanced",
-                "topics": ["Topic1", "Topic2"]
-            }}
-        ]
-        """
-
-        print(f"Sending prompt to Gemini: {prompt}")  # Debug log
-        
-        # Generate recommendations using Gemini with timeout
-        model = genai.GenerativeModel("gemini-pro")
-        response = await asyncio.wait_for(
-            asyncio.to_thread(model.generate_content, prompt),
-            timeout=15  # 15 seconds timeout
+        groups = split_book_history(book_history)
+        per_prompt = -(-num_recommendations // len(groups))
+        results = await asyncio.gather(
+            *(request_gemini_recommendations(group, per_prompt) for group in groups),
+            return_exceptions=True
         )
-        print(f"Raw Gemini response: {response.text}")  # Debug log
         
-        # Parse the response and convert to list of dictionaries
-        recommendations = json.loads(response.text)
-        print(f"Parsed recommendations: {recommendations}")  # Debug log
+        recommendations = []
+        seen_ids = set()
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning("Gemini prompt failed: %s", result)
+                continue
+            for rec in result:
+                book_id = generate_book_id(rec['title'], rec['author'])
+                if book_id not in seen_ids:
+                    seen_ids.add(book_id)
+                    recommendations.append(rec)
+        recommendations = recommendations[:num_recommendations]
+        logger.debug("Parsed %d recommendations", len(recommendations))
         
         if not recommendations:
-            print("No recommendations from Gemini, using fallback")
+            # Only timeouts and rate-limit errors are worth a retry
+            for result in results:
+                if isinstance(result, (asyncio.TimeoutError, ResourceExhausted)):
+                    raise result
+            logger.info("No recommendations from Gemini, using fallback")
             return get_fallback_recommendations()
-            
+        
+        cache_recommendations(cache_key, recommendations)
         return recommendations
     except asyncio.TimeoutError:
-        print("Gemini request timed out, retrying...")
+        logger.warning("Gemini request timed out, retrying...")
+        raise  # This will trigger a retry
+    except ResourceExhausted:
+        logger.warning("Gemini rate limit hit, backing off...")
         raise  # This will trigger a retry
-    except json.JSONDecodeError as e:
-        print(f"Error parsing Gemini response as JSON: {str(e)}")
-        print(f"Raw response that failed to parse: {response.text}")
-        print("Using fallback recommendations")
-        return get_fallback_recommendations()
     except Exception as e:
-        print(f"Error in generate_gemini_recommendations: {str(e)}")
-        print("Using fallback recommendations")
+        logger.error("Error in generate_gemini_recommendations, using fallback: %s", e)
         return get_fallback_recommendations()
 
+# Cache keys with a background refresh already scheduled
+_refreshing_keys = set()
+
+async def refresh_recommendations(book_history: List[Dict], num_recommendations: int):
+    """Regenerate and cache Gemini recommendations; meant to run after the response."""
+    key = recommendation_cache_key(book_history, num_recommendations)
+    try:
+        await generate_gemini_recommendations(book_history, num_recommendations)
+    except Exception as e:
+        logger.error("Background recommendation refresh failed: %s", e)
+    finally:
+        _refreshing_keys.discard(key)
+
+def get_stale_recommendations(book_history: List[Dict], num_recommendations: int,
+                              schedule_refresh: Callable) -> List[Dict]:
+    """Return cached recommendations at any age, or fallbacks if there are none.
+    
+    When the cached entry is missing or expired, a refresh is handed to
+    `schedule_refresh` (e.g. BackgroundTasks.add_task) so a later request
+    gets fresh results without this one waiting on Gemini.
+    """
+    key = recommendation_cache_key(book_history, num_recommendations)
+    entry = lookup_cached_recommendations(key)
+    if (entry is None or time.time() - entry[0] >= GEMINI_CACHE_TTL) and key not in _refreshing_keys:
+        _refreshing_keys.add(key)
+        schedule_refresh(refresh_recommendations, book_history, num_recommendations)
+    return entry[1] if entry else get_fallback_recommendations()
+
 async def get_personalized_recommendations(user_history: List[Dict], user_ratings: Dict[str, float], 
-                                  num_recommendations: int = 5) -> List[Dict]:
+                                  num_recommendations: int = 5,
+                                  schedule_refresh: Optional[Callable] = None) -> List[Dict]:
     """
     Get personalized recommendations combining both ML-based and LLM-based approaches.
+    
+    With `schedule_refresh`, cached (possibly stale) recommendations are
+    returned right away and Gemini runs in the background instead.
     """
     try:
-        print(f"Starting recommendations with history: {user_history}")  # Debug log
-        print(f"User ratings: {user_ratings}")  # Debug log
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Starting recommendations with history: %s", user_history)
+            logger.debug("User ratings: %s", user_ratings)
         
         # Format the book history for Gemini
         rated_books = []
+        history_by_id = {b['id']: b for b in user_history}
         for book_id, rating in user_ratings.items():
             # Get book details from history
-            book = next((b for b in user_history if b['id'] == book_id), None)
+            book = history_by_id.get(book_id)
             if book:
                 book_info = {
                     'title': book['title'],
@@ -180,10 +380,10 @@ async def get_personalized_recommendations(user_history: List[Dict], user_rating
                 }
                 rated_books.append(book_info)
         
-        print(f"Formatted rated books: {rated_books}")  # Debug log
+        logger.debug("Formatted %d rated books", len(rated_books))
         
         if not rated_books:
-            print("No rated books found, using fallback recommendations")
+            logger.info("No rated books found, using fallback recommendations")
             fallback_recs = get_fallback_recommendations()
             # Format fallback recommendations to match frontend expectations
             formatted_fallback = []
@@ -219,13 +419,15 @@ async def get_personalized_recommendations(user_history: List[Dict], user_rating
                             'page_count': None
                         })
                     except Exception as e:
-                        print(f"Error formatting fallback recommendation {rec}: {str(e)}")
+                        logger.warning("Error formatting fallback recommendation %s: %s", rec, e)
                         continue
             return formatted_fallback
         
-        # Get LLM recommendations with retries
-        llm_recommendations = await generate_gemini_recommendations(rated_books, num_recommendations)
-        print(f"LLM recommendations received: {llm_recommendations}")  # Debug log
+        # Get LLM recommendations with retries, or from cache while a refresh runs
+        if schedule_refresh is None or GEMINI_MODEL is None:
+            llm_recommendations = await generate_gemini_recommendations(rated_books, num_recommendations)
+        else:
+            llm_recommendations = get_stale_recommendations(rated_books, num_recommendations, schedule_refresh)
         
         # Convert recommendations to match our Book model format and save to database
         formatted_recommendations = []
@@ -265,16 +467,15 @@ async def get_personalized_recommendations(user_history: List[Dict], user_rating
                     }
                     formatted_recommendations.append(formatted_rec)
                 except Exception as e:
-                    print(f"Error formatting and saving recommendation {rec}: {str(e)}")
+                    logger.warning("Error formatting and saving recommendation %s: %s", rec, e)
                     continue
         
-        print(f"Final formatted recommendations: {formatted_recommendations}")  # Debug log
+        logger.debug("Returning %d recommendations", len(formatted_recommendations))
         return formatted_recommendations
         
     except Exception as e:
-        print(f"Error in get_personalized_recommendations: {str(e)}")
-        print(f"User history: {user_history}")
-        print(f"User ratings: {user_ratings}")
+        logger.error("Error in get_personalized_recommendations: %s", e)
+        logger.debug("User history: %s, user ratings: %s", user_history, user_ratings)
         fallback_recs = get_fallback_recommendations()
         # Format fallback recommendations to match frontend expectations
         formatted_fallback = []
@@ -310,6 +511,6 @@ async def get_personalized_recommendations(user_history: List[Dict], user_rating
                         'page_count': None
                     })
                 except Exception as e:
-                    print(f"Error formatting fallback recommendation {rec}: {str(e)}")
+                    logger.warning("Error formatting fallback recommendation %s: %s", rec, e)
                     continue
         return formatted_fallback 
\ No newline at end of file
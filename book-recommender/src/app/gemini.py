@@ -1,31 +1,49 @@
+import os
 import google.generativeai as genai
 from typing import List, Dict
 import json
+import orjson
+
+# Configure Gemini once; the model is shared across calls
+genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+GEMINI_MODEL = genai.GenerativeModel("gemini-1.5-flash")
+
+PROMPT_TEMPLATE = """Based on these liked books: {liked}
+    Recommend 5 books from this list:
+    {books}
+    
+    Return only the book titles that match exactly with the provided list, in JSON format like:
+    {{"recommendations": ["title1", "title2", "title3", "title4", "title5"]}}
+    """
 
 def get_gemini_recommendations(user_ratings: Dict[str, int], books_data: List[dict]) -> List[dict]:
     """Get book recommendations using Gemini AI"""
     
-    # Configure Gemini
-    genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    
     # Create prompt based on user ratings
     liked_books = [
         book["title"] for book_id, rating in user_ratings.items()
         for book in books_data if book["id"] == book_id and rating >= 4
     ]
     
-    prompt = f"""Based on these liked books: {', '.join(liked_books) if liked_books else 'No ratings yet'}
-    Recommend 5 books from this list:
-    {json.dumps([{'title': b['title'], 'author': b['author']} for b in books_data])}
-    
-    Return only the book titles that match exactly with the provided list, in JSON format like:
-    {{"recommendations": ["title1", "title2", "title3", "title4", "title5"]}}
-    """
+    prompt = PROMPT_TEMPLATE.format(
+        liked=', '.join(liked_books) if liked_books else 'No ratings yet',
+        books=json.dumps([{'title': b['title'], 'author': b['author']} for b in books_data])
+    )
     
     try:
-        response = model.generate_content(prompt)
-        recommendations_data = json.loads(response.text)
+        # Join the streamed chunks once; only parse when the text looks complete
+        chunks = []
+        recommendations_data = None
+        for chunk in GEMINI_MODEL.generate_content(prompt, stream=True):
+            chunks.append(chunk.text)
+            if chunk.text.rstrip().endswith(('}', ']')):
+                try:
+                    recommendations_data = orjson.loads("".join(chunks))
+                    break
+                except orjson.JSONDecodeError:
+                    continue
+        if recommendations_data is None:
+            recommendations_data = orjson.loads("".join(chunks))
         
         # Match recommended titles with full book data
         recommended_books = [
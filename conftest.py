@@ -0,0 +1,30 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+import database
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database initialized from schema.sql, as this thread's connection."""
+    monkeypatch.setattr(database, 'DATABASE_URL', str(tmp_path / 'books.db'))
+    monkeypatch.setattr(database, '_local', threading.local())
+    monkeypatch.setattr(database, '_initialized', False)
+    # init_db reads schema.sql from the working directory
+    monkeypatch.chdir(Path(__file__).parent)
+    database.init_db()
+    conn = database.get_db()
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def add_book(db):
+    """Insert a book the way the import scripts do, with an optional imported average."""
+    def add(book_id, title, author, imported_rating=None):
+        db.execute("""
+            INSERT INTO books (id, title, author, average_rating, imported_rating)
+            VALUES (?, ?, ?, COALESCE(?, 0), ?)
+        """, (book_id, title, author, imported_rating, imported_rating))
+        db.commit()
+    return add
@@ -1,42 +1,219 @@
 import sqlite3
 from contextlib import contextmanager
+import logging
 import os
+import random
+import threading
 from pathlib import Path
+from typing import List
 
 DATABASE_URL = os.environ.get('DATABASE_URL', 'books.db')
 
-def get_db():
-    """Get a database connection with Row factory."""
-    conn = sqlite3.connect(DATABASE_URL)
+logger = logging.getLogger("liberopus")
+
+# Long-lived connections for get_db, get_db_cursor and get_ro_db, one per thread
+_local = threading.local()
+# Set once init_db has run in this process
+_initialized = False
+# Per-connection tuning; WAL mode is persistent and set by get_db
+CONNECTION_PRAGMAS = (
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+)
+
+def connect_db(check_same_thread: bool = True):
+    """Open a new tuned database connection with Row factory.
+    
+    Pass check_same_thread=False only for a private connection that moves
+    between threads but is never used by two at once, such as one owned by
+    a generator that Starlette steps through on worker threads.
+    """
+    conn = sqlite3.connect(DATABASE_URL, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    return conn
+
+def get_db():
+    """Get this thread's persistent connection, opening and tuning it once.
+    
+    `with get_db() as db:` commits or rolls back but leaves the connection
+    open, so requests on the same thread keep its page cache. It belongs to
+    the calling thread: callers must not close it or keep it across an
+    await or a generator yield. Use connect_db for a private connection.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = connect_db()
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+    return conn
+
+def get_ro_db():
+    """Get this thread's cached read-only connection with Row factory.
+    
+    Opened in URI read-only mode and kept for the thread's lifetime, so read
+    endpoints reuse its page cache instead of reconnecting per request. A
+    private cache rather than cache=shared keeps WAL's lock-free readers.
+    """
+    conn = getattr(_local, 'ro_conn', None)
+    if conn is None:
+        uri = f"{Path(DATABASE_URL).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        conn.row_factory = sqlite3.Row
+        _local.ro_conn = conn
     return conn
 
 @contextmanager
 def get_db_cursor():
+    """Yield a cursor on the shared connection; commit on success, roll back on error."""
     conn = get_db()
+    cursor = conn.cursor()
     try:
-        cursor = conn.cursor()
         yield cursor
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     finally:
-        conn.close()
+        cursor.close()
+
+def fetch_random_books(db, limit: int = 5) -> List[sqlite3.Row]:
+    """Fetch up to `limit` random books with their average rating.
+    
+    Samples rowids in Python instead of ORDER BY RANDOM(), which would
+    assign a random key to every book and sort the whole table.
+    Accepts a connection or a cursor.
+    """
+    max_rowid = db.execute("SELECT MAX(rowid) FROM books").fetchone()[0] or 0
+    if max_rowid == 0:
+        return []
+    
+    # Oversample so gaps left by deleted rows still leave enough hits
+    rowids = random.sample(range(1, max_rowid + 1), min(max_rowid, limit * 4))
+    placeholders = ','.join(['?' for _ in rowids])
+    books = db.execute(f"""
+        SELECT b.id, b.title, b.author, b.description, b.topics, b.publication_year, b.page_count,
+               COALESCE(AVG(r.rating), 0) as average_rating
+        FROM books b
+        LEFT JOIN ratings r ON b.id = r.book_id
+        WHERE b.rowid IN ({placeholders})
+        GROUP BY b.id
+    """, rowids).fetchall()
+    
+    if len(books) < limit:
+        # Table is too sparse for rowid sampling, sort it instead
+        books = db.execute("""
+            SELECT b.id, b.title, b.author, b.description, b.topics, b.publication_year, b.page_count,
+                   COALESCE(AVG(r.rating), 0) as average_rating
+            FROM books b
+            LEFT JOIN ratings r ON b.id = r.book_id
+            GROUP BY b.id
+            ORDER BY RANDOM()
+            LIMIT ?
+        """, (limit,)).fetchall()
+    
+    random.shuffle(books)
+    return books[:limit]
+
+def migrate_schema(conn):
+    """Bring a database created from an older schema.sql up to date.
+    
+    CREATE TABLE IF NOT EXISTS leaves existing tables alone, so columns added
+    since are added here, along with indexes that old data may reject.
+    Accepts a connection or a cursor.
+    """
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(books)").fetchall()}
+    if 'topics_mask' not in columns:
+        conn.execute("ALTER TABLE books ADD COLUMN topics_mask INTEGER")
+    if 'imported_rating' not in columns:
+        conn.execute("ALTER TABLE books ADD COLUMN imported_rating REAL")
+        # An average on a book nobody has rated locally came from an import
+        conn.execute("""
+            UPDATE books SET imported_rating = average_rating
+            WHERE average_rating > 0
+              AND NOT EXISTS (SELECT 1 FROM ratings WHERE book_id = books.id)
+        """)
+    if 'rating_count' not in columns:
+        conn.execute("ALTER TABLE books ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE books ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0")
+        # Backfill the running totals the ratings triggers maintain from now on
+        conn.execute("""
+            UPDATE books SET
+                rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM ratings WHERE book_id = books.id),
+                rating_count = (SELECT COUNT(*) FROM ratings WHERE book_id = books.id)
+        """)
+        # Only books rated locally; unrated ones keep their imported average
+        conn.execute("""
+            UPDATE books SET average_rating = rating_sum * 1.0 / rating_count
+            WHERE rating_count > 0
+        """)
+    
+    # Superseded rating triggers, replaced by trg_ratings_local_*: the first set
+    # zeroed imported averages, the second blended them into the local average
+    old_triggers = [row['name'] for row in conn.execute("""
+        SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (
+            'trg_ratings_ai', 'trg_ratings_au', 'trg_ratings_ad',
+            'trg_book_ratings_ai', 'trg_book_ratings_au', 'trg_book_ratings_ad'
+        )
+    """).fetchall()]
+    for trigger in old_triggers:
+        conn.execute(f"DROP TRIGGER {trigger}")
+    if any(trigger.startswith('trg_book_ratings') for trigger in old_triggers):
+        conn.execute("""
+            UPDATE books SET average_rating = rating_sum * 1.0 / rating_count
+            WHERE rating_count > 0
+        """)
+    
+    # Best-rated-first reads use the materialized average instead of aggregating ratings
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_average_rating ON books(average_rating DESC)")
+    
+    # Embeddings are now int8 with a per-vector scale; older float32 rows are
+    # only a cache, so the table is rebuilt and books are re-embedded on demand
+    embedding_columns = {row['name'] for row in conn.execute("PRAGMA table_info(book_embeddings)").fetchall()}
+    if 'scale' not in embedding_columns:
+        conn.execute("DROP TABLE IF EXISTS book_embeddings")
+        conn.execute(
+            "CREATE TABLE book_embeddings (book_id TEXT PRIMARY KEY, scale REAL NOT NULL, vec BLOB NOT NULL)"
+        )
+    
+    # One rating per book, so rating endpoints can upsert on book_id
+    has_unique_rating_index = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_ratings_book_id_unique'"
+    ).fetchone()
+    if not has_unique_rating_index:
+        # Keep the latest rating for books rated more than once
+        conn.execute("DELETE FROM ratings WHERE id NOT IN (SELECT MAX(id) FROM ratings GROUP BY book_id)")
+        conn.execute("CREATE UNIQUE INDEX idx_ratings_book_id_unique ON ratings(book_id)")
+        conn.execute("DROP INDEX IF EXISTS idx_ratings_book_id")
+    
+    # Unique title/author index, unless legacy duplicate rows prevent it
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_books_title_author ON books(title, author)")
+    except sqlite3.IntegrityError:
+        logger.warning("Duplicate books found, creating a non-unique title/author index")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_books_title_author_dup ON books(title, author)")
+    
+    # Same book regardless of case; existing case-variant duplicates block it
+    # until they are merged with /remove-duplicates
+    try:
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_books_title_author_nocase "
+            "ON books(LOWER(title), LOWER(author))"
+        )
+    except sqlite3.IntegrityError:
+        logger.warning("Books differing only in case found, skipping the case-insensitive title/author index")
 
 def init_db():
-    """Initialize the database."""
+    """Initialize the database from schema.sql; later calls in the process are no-ops."""
+    global _initialized
+    if _initialized:
+        return
+    
+    logger.info("Initializing database...")
     with get_db_cursor() as cursor:
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS books (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                description TEXT,
-                average_rating REAL DEFAULT 0,
-                topics TEXT,
-                publication_year INTEGER,
-                page_count INTEGER
-            )
-        """)
-        
         # Read schema
         schema_path = Path('schema.sql')
         if not schema_path.exists():
@@ -45,13 +222,16 @@ def init_db():
         with open(schema_path) as f:
             cursor.executescript(f.read())
         
-        print("Database initialized successfully")
+        migrate_schema(cursor)
+    
+    _initialized = True
+    logger.info("Database initialized successfully")
 
 def get_db_connection():
     """Get a database connection for the current request."""
     try:
-        conn = get_db()
+        conn = connect_db()
         return conn
     except Exception as e:
-        print(f"Error connecting to database: {e}")
+        logger.error("Error connecting to database: %s", e)
         raise 
\ No newline at end of file
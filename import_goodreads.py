@@ -1,6 +1,11 @@
 import csv
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+# Concurrent POSTs to the API, each on a pooled keep-alive connection
+IMPORT_WORKERS = 16
 
 def clean_isbn(isbn):
     """Clean ISBN by removing quotes and equals signs"""
@@ -8,47 +13,57 @@ def clean_isbn(isbn):
         return ""
     return isbn.replace('="', '').replace('"', '')
 
+def post_book(session, api_url, book_data):
+    """Send one book to the API and report the result"""
+    try:
+        # Send POST request to add book
+        response = session.post(api_url, json=book_data)
+        if response.status_code == 200:
+            print(f"Successfully added: {book_data['title']}")
+        else:
+            print(f"Failed to add {book_data['title']}: {response.text}")
+    except Exception as e:
+        print(f"Error adding {book_data['title']}: {str(e)}")
+
 def import_goodreads_books():
     """Import books from Goodreads CSV export"""
     # API endpoint
     api_url = "http://localhost:8000/add-book"
     
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=IMPORT_WORKERS, pool_maxsize=IMPORT_WORKERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    
     # Read CSV file
-    with open('goodreads_library_export.csv', 'r', encoding='utf-8') as file:
-        # Read all lines to debug
-        content = file.readlines()
-        # Get header line and clean it
-        header = content[0].strip().split(',')
-        # Create CSV reader with cleaned header
-        reader = csv.DictReader(content[1:], fieldnames=header)
+    with open('goodreads_library_export.csv', 'r', encoding='utf-8', newline='') as file, \
+            session, ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as executor:
+        # Stream rows straight from the file; the export has a header row
+        reader = csv.DictReader(file)
+        current_year = datetime.now().year
         
         for row in reader:
             # Skip empty rows
             if not row.get('Title'):
                 continue
                 
+            # Classify once per row; shelves drive both categories and topics
+            is_programming = "Programming" in (row.get('Bookshelves') or '')
+            
             # Clean and prepare book data
             book_data = {
                 "title": row['Title'].strip(),
                 "author": row['Author'].strip(),
-                "categories": ["Technical"] if row.get('Bookshelves') and "Programming" in row['Bookshelves'] else ["General"],
+                "categories": ["Technical"] if is_programming else ["General"],
                 "technical_level": "intermediate",  # Default level
-                "topics": ["Programming"] if row.get('Bookshelves') and "Programming" in row['Bookshelves'] else ["General"],
+                "topics": ["Programming"] if is_programming else ["General"],
                 "description": f"A book titled '{row['Title']}' by {row['Author']}",
                 "avg_rating": float(row['Average Rating']) if row.get('Average Rating') and row['Average Rating'] else 0.0,
                 "page_count": int(row['Number of Pages']) if row.get('Number of Pages') and row['Number of Pages'] else 300,
-                "publication_year": int(row['Year Published']) if row.get('Year Published') and row['Year Published'] else datetime.now().year
+                "publication_year": int(row['Year Published']) if row.get('Year Published') and row['Year Published'] else current_year
             }
-            
-            try:
-                # Send POST request to add book
-                response = requests.post(api_url, json=book_data)
-                if response.status_code == 200:
-                    print(f"Successfully added: {book_data['title']}")
-                else:
-                    print(f"Failed to add {book_data['title']}: {response.text}")
-            except Exception as e:
-                print(f"Error adding {book_data['title']}: {str(e)}")
+            # POST in the background; failures are reported by post_book
+            executor.submit(post_book, session, api_url, book_data)
 
 if __name__ == "__main__":
     print("Starting Goodreads import...")
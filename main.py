@@ -1,20 +1,92 @@
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional
 import numpy as np
+import asyncio
 import google.generativeai as genai
 from models import Book, Rating
 from datetime import datetime
+import hashlib
 import json
+import orjson
+import time
 from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException
-from database import get_db, init_db
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from database import connect_db, get_db, get_db_cursor, init_db, migrate_schema
+import ollama
 import os
+from rapidfuzz import fuzz, process, utils
 
 # Configure Gemini
 genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-MODEL = genai.GenerativeModel('gemini-1.5-pro')
+GEMINI_MODEL_NAME = 'gemini-1.5-pro'
+MODEL = genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+# Gemini embedding model used to rank candidates against the user's liked books
+EMBEDDING_MODEL = "models/text-embedding-004"
+# Texts per embed_content call (the API's per-request limit)
+EMBEDDING_BATCH_SIZE = 100
+
+# Upper bound on concurrent Gemini requests from the recommendation engine
+GEMINI_MAX_CONCURRENCY = 8
+# Gemini responses are stored in the gemini_cache table and reused for a day
+GEMINI_CACHE_TTL = 86400
+# Unrated books offered to Gemini for ranking, best average rating first
+RECOMMENDATION_CANDIDATES = 50
+
+# Rows per chunk when streaming /books; each chunk is one threadpool hop
+BOOKS_STREAM_BATCH = 500
+
+# Rows scored per rapidfuzz cdist call when looking for fuzzy duplicates
+FUZZY_BLOCK_SIZE = 1000
+
+# Local Llama model served by Ollama, used for book summaries
+MODEL_NAME = os.getenv('OLLAMA_MODEL', 'llama2:13b')
+# Summaries are short; capping output tokens bounds generation time
+SUMMARY_OPTIONS = {"num_predict": 256, "temperature": 0.2}
+
+# Static prompt text; only the book fields and lists are filled in per call
+ANALYZE_PROMPT_TEMPLATE = """
+Analyze this book and extract key topics and themes:
+Title: {title}
+Author: {author}
+Description: {description}
+
+Return your analysis as a JSON string with these keys:
+- topics: list of main topics
+- themes: list of major themes
+- target_audience: string describing ideal reader
+"""
+
+RANK_PROMPT_TEMPLATE = """
+Based on these books the user likes:
+{liked}
+
+Rank these unread books from most to least recommended (return just the numbers in order):
+{candidates}
+
+Return only the numbers in order, separated by commas.
+"""
+
+SUMMARY_SYSTEM_PROMPT = """You are a technical book summarizer. Create a concise summary focusing on:
+1. Key technical concepts
+2. Practical applications
+3. Prerequisites and target audience
+4. Learning progression
+
+Keep the summary technical and focused on what the reader will learn.
+Respond in JSON with keys summary, key_concepts, prerequisites and target_audience.
+"""
+
+SUMMARY_BOOK_TEMPLATE = """
+Title: {title}
+Author: {author}
+Technical Level: {technical_level}
+Topics: {topics}
+Description: {description}
+"""
 
 # Create FastAPI app instance
-app = FastAPI(title="Book Recommender API")
+app = FastAPI(title="Book Recommender API", default_response_class=ORJSONResponse)
 
 # Initialize database on startup
 @app.on_event("startup")
@@ -23,127 +95,303 @@ async def startup_event():
 
 
 
+def generate_book_id(title: str, author: str) -> str:
+    """Generate a stable book ID from title and author."""
+    combined = (title + author).encode('utf-8')
+    return hashlib.blake2b(combined, digest_size=8).hexdigest()
+
 def convert_db_book_to_model(book_row) -> Book:
-    """Convert a database row to a Book model."""
-    return Book(
-        id=str(book_row["id"]),
-        title=book_row["title"],
-        author=book_row["author"],
-        description=book_row["description"],
-        technical_level=book_row["technical_level"],
-        average_rating=float(book_row["average_rating"]) if "average_rating" in book_row else 0.0,
-        rating_count=int(book_row["rating_count"]) if "rating_count" in book_row else 0,
-        page_count=book_row["page_count"],
-        publication_year=book_row["publication_year"],
-        topics=["General"],
-        categories=["General"]
-    )
+    """Convert a database row to a Book model, skipping validation of trusted columns."""
+    return Book.model_construct(**book_row_to_dict(book_row))
+
+def book_row_to_dict(book_row) -> dict:
+    """Convert a books row to a plain dict, skipping model validation.
+    
+    Every books row carries the trigger-maintained average_rating and
+    rating_count columns, so they are read directly; the REAL and INTEGER
+    column types already give Python floats and ints.
+    """
+    return {
+        "id": str(book_row["id"]),
+        "title": book_row["title"],
+        "author": book_row["author"],
+        "description": book_row["description"],
+        "technical_level": book_row["technical_level"],
+        "average_rating": book_row["average_rating"] or 0.0,
+        "rating_count": book_row["rating_count"],
+        "page_count": book_row["page_count"],
+        "publication_year": book_row["publication_year"],
+        "topics": ["General"],
+        "categories": ["General"]
+    }
 
 # API Routes
 @app.get("/")
 async def root():
     return {"message": "Book Recommender API is running"}
 
+def open_books_cursor():
+    """Run the /books query and fetch its first chunk. Blocking.
+    
+    Returns the private connection, its cursor and the first rows, so query
+    errors surface before any response bytes are sent.
+    """
+    # Private connection, stepped through by one worker thread at a time
+    db = connect_db(check_same_thread=False)
+    # Plain tuples in a fixed column order; no per-field name lookups
+    db.row_factory = None
+    try:
+        # average_rating and rating_count are kept current by the ratings triggers
+        cursor = db.execute("""
+            SELECT id, title, author, description, technical_level,
+                   page_count, publication_year,
+                   CAST(COALESCE(average_rating, 0.0) AS REAL), rating_count
+            FROM books
+            ORDER BY id DESC
+        """)
+        return db, cursor, cursor.fetchmany(BOOKS_STREAM_BATCH)
+    except BaseException:
+        db.close()
+        raise
+
+def stream_books(db, cursor, rows):
+    """Yield the /books JSON document in chunks of rows, closing the connection at the end."""
+    try:
+        yield b'{"books":['
+        separator = b''
+        while rows:
+            yield separator + b','.join(
+                orjson.dumps({
+                    "id": str(book_id),
+                    "title": title,
+                    "author": author,
+                    "description": description,
+                    "technical_level": technical_level,
+                    "average_rating": average_rating,
+                    "rating_count": rating_count,
+                    "page_count": page_count,
+                    "publication_year": publication_year,
+                    "topics": ["General"],
+                    "categories": ["General"]
+                })
+                for (book_id, title, author, description, technical_level,
+                     page_count, publication_year, average_rating, rating_count) in rows
+            )
+            separator = b','
+            rows = cursor.fetchmany(BOOKS_STREAM_BATCH)
+        yield b']}'
+    except Exception as e:
+        print(f"Error loading books: {str(e)}")
+        raise
+    finally:
+        db.close()
+
 @app.get("/books")
 async def get_books():
-    """Get all books from the database."""
+    """Get all books from the database, streamed as they are read."""
     try:
-        with get_db() as db:
-            cursor = db.execute("""
-                SELECT b.*, 
-                       COALESCE(AVG(r.rating), 0) as average_rating,
-                       COUNT(r.id) as rating_count
-                FROM books b
-                LEFT JOIN ratings r ON b.id = r.book_id
-                GROUP BY b.id
-                ORDER BY b.id DESC
-            """)
-            books = cursor.fetchall()
-            
-            # Convert SQLite Row objects to Book models
-            return {
-                "books": [convert_db_book_to_model(book) for book in books]
-            }
+        db, cursor, rows = await asyncio.to_thread(open_books_cursor)
     except Exception as e:
-        print(f"Error loading books: {str(e)}")  # Add logging
+        print(f"Error loading books: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(stream_books(db, cursor, rows), media_type="application/json")
 
-@app.get("/remove-duplicates")
-async def remove_duplicates():
-    """Remove duplicate books from the database based on title and author."""
-    try:
-        # Get all books
-        with get_db() as db:
-            # Get all books
-            cursor = db.execute("""
-                SELECT id, title, author 
-                FROM books 
-                ORDER BY id
-            """)
-            all_books = cursor.fetchall()
-            
-            # Create a dictionary to track unique books
-            unique_books = {}
-            duplicates = []
-            
-            # Find duplicates
-            for book in all_books:
-                key = (book[1].lower().strip(), book[2].lower().strip())  # title, author
-                if key in unique_books:
-                    # This is a duplicate - keep the one with lower ID
-                    original_id = unique_books[key]
-                    duplicate_id = book[0]
-                    duplicates.append({
-                        'duplicate_id': duplicate_id,
-                        'original_id': original_id
-                    })
-                else:
-                    unique_books[key] = book[0]  # id
-            
-            # Update ratings to point to original books
-            for dup in duplicates:
-                db.execute("""
-                    UPDATE ratings 
-                    SET book_id = ? 
-                    WHERE book_id = ?
-                """, (dup['original_id'], dup['duplicate_id']))
-                
-                # Delete duplicate book
-                db.execute("DELETE FROM books WHERE id = ?", (dup['duplicate_id'],))
-            
-            db.commit()
-            
+# Every book that repeats another's title and author (ignoring case), paired
+# with the lowest id in its group, which is the copy that is kept
+DUPLICATE_BOOKS_SQL = """
+    SELECT id AS duplicate_id, keep_id AS id FROM (
+        SELECT id, MIN(id) OVER (PARTITION BY LOWER(TRIM(title)), LOWER(TRIM(author))) AS keep_id
+        FROM books
+        WHERE id IS NOT NULL
+    )
+    WHERE id != keep_id
+"""
+
+def merge_duplicate_books(db, duplicates_sql: str) -> int:
+    """Fold each duplicate book into the copy it maps to; returns books removed.
+    
+    `duplicates_sql` selects (duplicate_id, id) pairs, `id` being the book kept.
+    """
+    # One transaction: move ratings to the kept copy, then drop the rest
+    with db:
+        db.execute(f"""
+            UPDATE OR IGNORE ratings SET book_id = keep.id
+            FROM ({duplicates_sql}) AS keep
+            WHERE ratings.book_id = keep.duplicate_id
+        """)
+        # Ratings that could not move because the kept copy is rated too
+        db.execute(f"DELETE FROM ratings WHERE book_id IN (SELECT duplicate_id FROM ({duplicates_sql}))")
+        cursor = db.execute(f"DELETE FROM books WHERE id IN (SELECT duplicate_id FROM ({duplicates_sql}))")
+        return cursor.rowcount
+
+def find_fuzzy_duplicates(books, threshold: int, block_size: int = FUZZY_BLOCK_SIZE):
+    """Pair near-identical books with the lowest id in their cluster.
+    
+    Scores "title|author" pairs with rapidfuzz's C++ cdist, one block of rows
+    at a time against the rows after it, so memory stays at block_size x N
+    and each pair is scored once. Matching pairs are joined into clusters so
+    chains of near-matches merge together.
+    """
+    keys = [f"{book['title']}|{book['author']}" for book in books]
+    
+    parent = list(range(len(books)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for start in range(0, len(keys), block_size):
+        scores = process.cdist(keys[start:start + block_size], keys[start:], scorer=fuzz.token_sort_ratio,
+                               processor=utils.default_process, score_cutoff=threshold,
+                               dtype=np.uint8, workers=-1)
+        rows, cols = scores.nonzero()
+        # Row r is book start + r and column c is book start + c; keep j > i only
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            if c > r:
+                parent[find(start + c)] = find(start + r)
+    
+    keep = {}
+    for i, book in enumerate(books):
+        root = find(i)
+        if root not in keep or book['id'] < keep[root]:
+            keep[root] = book['id']
+    return [
+        (book['id'], keep[find(i)])
+        for i, book in enumerate(books)
+        if book['id'] != keep[find(i)]
+    ]
+
+def plan_duplicate_merges(db, fuzzy: bool, threshold: int):
+    """Return the books that would be merged and the (duplicate_id, id) pairs to merge.
+    
+    Exact duplicates come from DUPLICATE_BOOKS_SQL; with `fuzzy`, near-matches
+    among the books that survive those are added. Chains are resolved so every
+    duplicate maps straight to the book that is finally kept.
+    """
+    books = {row['id']: row for row in db.execute("SELECT id, title, author FROM books WHERE id IS NOT NULL")}
+    keep = dict(db.execute(DUPLICATE_BOOKS_SQL).fetchall())
+    if fuzzy:
+        survivors = [book for book_id, book in books.items() if book_id not in keep]
+        keep.update(find_fuzzy_duplicates(survivors, threshold))
+    
+    # Both passes map to a lower id, so following the chain always ends
+    pairs = []
+    for duplicate_id, book_id in keep.items():
+        while book_id in keep:
+            book_id = keep[book_id]
+        pairs.append((duplicate_id, book_id))
+    return books, pairs
+
+def remove_duplicate_books(fuzzy: bool, threshold: int, dry_run: bool) -> dict:
+    """Merge duplicate books, or with `dry_run` only report the clusters. Blocking."""
+    with get_db() as db:
+        books, pairs = plan_duplicate_merges(db, fuzzy, threshold)
+        
+        if dry_run:
+            clusters = {}
+            for duplicate_id, book_id in pairs:
+                clusters.setdefault(book_id, []).append(duplicate_id)
             return {
-                "message": f"Removed {len(duplicates)} duplicate books",
-                "duplicates_removed": len(duplicates)
+                "message": f"Would remove {len(pairs)} duplicate books",
+                "duplicates_found": len(pairs),
+                "clusters": [
+                    {
+                        "keep": dict(books[book_id]),
+                        "duplicates": [dict(books[duplicate_id]) for duplicate_id in duplicate_ids]
+                    }
+                    for book_id, duplicate_ids in clusters.items()
+                ]
             }
-            
+        
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS duplicate_merges (duplicate_id TEXT, id TEXT)")
+        db.execute("DELETE FROM duplicate_merges")
+        db.executemany("INSERT INTO duplicate_merges VALUES (?, ?)", pairs)
+        removed = merge_duplicate_books(db, "SELECT duplicate_id, id FROM duplicate_merges")
+        
+        # With duplicates gone the case-insensitive unique index can be built
+        migrate_schema(db)
+        db.commit()
+        return {
+            "message": f"Removed {removed} duplicate books",
+            "duplicates_removed": removed
+        }
+
+@app.post("/remove-duplicates")
+async def remove_duplicates(fuzzy: bool = False, threshold: int = Query(90, ge=85, le=100), dry_run: bool = False):
+    """Remove duplicate books from the database based on title and author.
+    
+    By default only exact matches (ignoring case and surrounding spaces) are
+    merged. With `fuzzy`, title/author pairs scoring at least `threshold`
+    (85-100) are merged as well, catching variants like abbreviated authors.
+    Deletes cannot be undone, so `dry_run` returns the proposed clusters
+    without changing anything.
+    """
+    try:
+        return await asyncio.to_thread(remove_duplicate_books, fuzzy, threshold, dry_run)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to remove duplicates: {str(e)}")
 
+def parse_analysis(text: str) -> str:
+    """Return a book analysis reply unchanged, raising if it is not valid JSON."""
+    json.loads(text)
+    return text
+
+def parse_rankings(text: str, num_candidates: int) -> List[int]:
+    """Parse a comma-separated ranking reply into 1-based candidate numbers."""
+    rankings = [int(x) for x in text.split(',')]
+    if not all(1 <= rank <= num_candidates for rank in rankings):
+        raise ValueError(f"Ranking out of range: {text!r}")
+    return rankings
+
 class RecommendationEngine:
     """Book recommendation engine using Gemini for content analysis and recommendations."""
     
     def __init__(self):
         self.model = MODEL
+        self._semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    
+    @staticmethod
+    def _read_cache(key: str):
+        """Return the gemini_cache row for the key, if any. Blocking."""
+        with get_db_cursor() as cursor:
+            cursor.execute("SELECT response, ts FROM gemini_cache WHERE key = ?", (key,))
+            return cursor.fetchone()
+    
+    @staticmethod
+    def _write_cache(key: str, response: str):
+        """Store a Gemini reply in gemini_cache. Blocking."""
+        with get_db_cursor() as cursor:
+            cursor.execute(
+                "INSERT OR REPLACE INTO gemini_cache (key, response, ts) VALUES (?, ?, ?)",
+                (key, response, int(time.time()))
+            )
     
-    def analyze_book_content(self, book: Book) -> str:
+    async def _cached_generate(self, prompt: str, parse: Callable[[str], Any]) -> Any:
+        """Return Gemini's parsed reply to the prompt, from gemini_cache when possible.
+        
+        A reply is cached only after `parse` accepts it, so a malformed or
+        truncated reply raises and is retried next time instead of being
+        served for the whole TTL.
+        """
+        key = hashlib.sha256(f"{GEMINI_MODEL_NAME}\0{prompt}".encode('utf-8')).hexdigest()
+        row = await asyncio.to_thread(self._read_cache, key)
+        if row and time.time() - row['ts'] < GEMINI_CACHE_TTL:
+            return parse(row['response'])
+        
+        async with self._semaphore:
+            response = await self.model.generate_content_async(prompt)
+        result = parse(response.text)
+        await asyncio.to_thread(self._write_cache, key, response.text)
+        return result
+    
+    async def analyze_book_content(self, book: Book) -> str:
         """Analyze book content using Gemini."""
         try:
-            prompt = f"""
-            Analyze this book and extract key topics and themes:
-            Title: {book.title}
-            Author: {book.author}
-            Description: {book.description}
-            
-            Return your analysis as a JSON string with these keys:
-            - topics: list of main topics
-            - themes: list of major themes
-            - target_audience: string describing ideal reader
-            """
-            
-            response = self.model.generate_content(prompt)
-            return response.text
+            prompt = ANALYZE_PROMPT_TEMPLATE.format(
+                title=book.title, author=book.author, description=book.description
+            )
+            return await self._cached_generate(prompt, parse_analysis)
         except Exception as e:
             print(f"Error analyzing book: {str(e)}")
             return json.dumps({
@@ -152,7 +400,76 @@ class RecommendationEngine:
                 "target_audience": "General readers"
             })
     
-    def get_recommendations(self, user_books: List[Book], available_books: List[Book], user_ratings: Dict[str, int], num_recommendations: int = 5) -> List[Book]:
+    async def analyze_books(self, books: List[Book]) -> List[str]:
+        """Analyze several books with concurrent Gemini requests."""
+        return await asyncio.gather(*(self.analyze_book_content(book) for book in books))
+    
+    def embed_books_batch(self, books: List[Book], batch_size: int = EMBEDDING_BATCH_SIZE) -> Dict[str, tuple]:
+        """Embed books with one Gemini call per batch and store the vectors. Blocking.
+        
+        Vectors are unit-length and quantized to int8 with a per-vector scale;
+        returns (scale, int8 vector) pairs keyed by book ID.
+        """
+        vectors = {}
+        for start in range(0, len(books), batch_size):
+            chunk = books[start:start + batch_size]
+            result = genai.embed_content(
+                model=EMBEDDING_MODEL,
+                content=[f"{book.title} by {book.author}. {book.description or ''}" for book in chunk],
+                task_type="retrieval_document"
+            )
+            matrix = np.asarray(result['embedding'], dtype=np.float32)
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+            scales = np.abs(matrix).max(axis=1) / 127
+            quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+            entries = {book.id: (float(scale), vec) for book, scale, vec in zip(chunk, scales, quantized)}
+            with get_db_cursor() as cursor:
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO book_embeddings (book_id, scale, vec) VALUES (?, ?, ?)",
+                    [(book_id, scale, vec.tobytes()) for book_id, (scale, vec) in entries.items()]
+                )
+            vectors.update(entries)
+        return vectors
+    
+    def load_embeddings(self, books: List[Book]) -> Dict[str, tuple]:
+        """Return the stored (scale, int8 vector) pairs for the given books, keyed by book ID."""
+        ids = [book.id for book in books]
+        with get_db_cursor() as cursor:
+            cursor.execute(
+                f"SELECT book_id, scale, vec FROM book_embeddings WHERE book_id IN ({','.join('?' * len(ids))})",
+                ids
+            )
+            return {
+                row['book_id']: (row['scale'], np.frombuffer(row['vec'], dtype=np.int8))
+                for row in cursor.fetchall()
+            }
+    
+    async def rank_by_embeddings(self, liked_books: List[Book], candidates: List[Book], num_recommendations: int) -> Optional[List[Book]]:
+        """Rank candidates by cosine similarity to the mean of the liked books.
+        
+        Books without a stored vector are embedded in batches first. Returns None if
+        embedding fails, so the caller can fall back to the Gemini ranking.
+        """
+        try:
+            vectors = await asyncio.to_thread(self.load_embeddings, liked_books + candidates)
+            missing = list({book.id: book for book in liked_books + candidates if book.id not in vectors}.values())
+            if missing:
+                vectors.update(await asyncio.to_thread(self.embed_books_batch, missing))
+        except Exception as e:
+            print(f"Error embedding books: {str(e)}")
+            return None
+        
+        liked_scales, liked_vecs = zip(*(vectors[book.id] for book in liked_books))
+        user_vec = np.mean(np.vstack(liked_vecs) * np.array(liked_scales, dtype=np.float32)[:, None], axis=0)
+        # Score the int8 matrix directly and apply each candidate's scale afterwards
+        scales, quantized = zip(*(vectors[book.id] for book in candidates))
+        scores = (np.vstack(quantized).astype(np.float32) @ user_vec) * np.array(scales, dtype=np.float32)
+        k = min(num_recommendations, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [candidates[i] for i in top]
+    
+    async def get_recommendations(self, user_books: List[Book], available_books: List[Book], user_ratings: Dict[str, int], num_recommendations: int = 5) -> List[Book]:
         """Get book recommendations using Gemini."""
         try:
             # Filter out books the user has already rated
@@ -162,25 +479,27 @@ class RecommendationEngine:
                 return []
             
             # Get highly rated books (rating >= 4)
-            liked_books = [book for book in user_books if user_ratings.get(str(book.id), 0) >= 4]
+            liked_ids = {book_id for book_id, rating in user_ratings.items() if rating >= 4}
+            liked_books = [book for book in user_books if str(book.id) in liked_ids] if liked_ids else []
             
             if not liked_books:
                 # If no highly rated books, return top rated unread books
                 return sorted(unrated_books, key=lambda x: x.average_rating, reverse=True)[:num_recommendations]
             
-            # Create prompt for Gemini
-            prompt = f"""
-            Based on these books the user likes:
-            {', '.join([f"'{book.title}' by {book.author}" for book in liked_books])}
-            
-            Rank these unread books from most to least recommended (return just the numbers in order):
-            {', '.join([f"{i+1}. '{book.title}' by {book.author}" for i, book in enumerate(unrated_books)])}
+            # Rank locally by embedding similarity; ask Gemini only if that fails
+            ranked = await self.rank_by_embeddings(liked_books, unrated_books, num_recommendations)
+            if ranked is not None:
+                return ranked
             
-            Return only the numbers in order, separated by commas.
-            """
+            # Create prompt for Gemini
+            prompt = RANK_PROMPT_TEMPLATE.format(
+                liked=", ".join(f"'{book.title}' by {book.author}" for book in liked_books),
+                candidates="\n".join(f"{i}. '{book.title}' by {book.author}" for i, book in enumerate(unrated_books, 1))
+            )
             
-            response = self.model.generate_content(prompt)
-            rankings = [int(x.strip()) for x in response.text.split(',')]
+            rankings = await self._cached_generate(
+                prompt, lambda text: parse_rankings(text, len(unrated_books))
+            )
             
             # Sort books based on Gemini's rankings
             recommended_books = []
@@ -192,41 +511,53 @@ class RecommendationEngine:
         except Exception as e:
             print(f"Error getting recommendations: {str(e)}")
             # Fallback to rating-based recommendations
-            return sorted(unrated_books, key=lambda x: x.avg_rating, reverse=True)[:num_recommendations]
+            return sorted(unrated_books, key=lambda x: x.average_rating, reverse=True)[:num_recommendations]
 
 # Initialize recommendation engine
 recommender = RecommendationEngine()
 
+class RecommendationRequest(BaseModel):
+    """Request model for getting recommendations"""
+    user_history: List[str] = []
+    user_ratings: Dict[str, int]
+
+def fetch_recommendation_books(rated_ids: tuple):
+    """Return the user's rated books and the best-rated candidates. Blocking."""
+    placeholders = ",".join("?" * len(rated_ids))
+    with get_db() as db:
+        # Books the user has rated, for the "liked" part of the prompt
+        rated_books = []
+        if rated_ids:
+            cursor = db.execute(f"SELECT * FROM books WHERE id IN ({placeholders})", rated_ids)
+            rated_books = [convert_db_book_to_model(book) for book in cursor.fetchall()]
+        
+        # Best-rated unrated books are the candidates Gemini ranks; the
+        # trigger-maintained average lets this walk idx_books_average_rating
+        cursor = db.execute(f"""
+            SELECT * FROM books
+            WHERE id NOT IN ({placeholders})
+            ORDER BY average_rating DESC
+            LIMIT ?
+        """, (*rated_ids, RECOMMENDATION_CANDIDATES))
+        available_books = [convert_db_book_to_model(book) for book in cursor.fetchall()]
+    return rated_books, available_books
+
 @app.post("/get-recommendations")
 async def get_recommendations(request: RecommendationRequest):
     """Get personalized book recommendations."""
     try:
-        with get_db() as db:
-            # Get all available books
-            cursor = db.execute("""
-                SELECT b.*, 
-                       COALESCE(AVG(r.rating), 0) as avg_rating,
-                       COUNT(r.id) as rating_count
-                FROM books b
-                LEFT JOIN ratings r ON b.id = r.book_id
-                GROUP BY b.id
-            """)
-            all_books = cursor.fetchall()
-            
-            # Convert to Book models
-            available_books = [convert_db_book_to_model(book) for book in all_books]
-            
-            # Get user's rated books
-            rated_books = [book for book in available_books if str(book.id) in request.user_ratings]
-            
-            # Get recommendations using Gemini
-            recommendations = recommender.get_recommendations(
-                user_books=rated_books,
-                available_books=available_books,
-                user_ratings=request.user_ratings
-            )
-            
-            return {"recommendations": recommendations}
+        rated_books, available_books = await asyncio.to_thread(
+            fetch_recommendation_books, tuple(request.user_ratings.keys())
+        )
+        
+        # Get recommendations using Gemini
+        recommendations = await recommender.get_recommendations(
+            user_books=rated_books,
+            available_books=available_books,
+            user_ratings=request.user_ratings
+        )
+        
+        return {"recommendations": recommendations}
             
     except Exception as e:
         print(f"Error getting recommendations: {str(e)}")
@@ -242,6 +573,8 @@ class BookSummarizer:
     """
     def __init__(self, model_name: str = MODEL_NAME):
         self.model_name = model_name
+        # One client per summarizer so its HTTP connection is kept alive
+        self.client = ollama.Client()
         
     def generate_technical_summary(self, book: Book) -> str:
         """
@@ -253,43 +586,28 @@ class BookSummarizer:
         Returns:
             str: Technical summary highlighting key concepts
         """
-        system_prompt = """You are a technical book summarizer. Create a concise summary focusing on:
-        1. Key technical concepts
-        2. Practical applications
-        3. Prerequisites and target audience
-        4. Learning progression
-        
-        Keep the summary technical and focused on what the reader will learn.
-        Format your response as a JSON object with these exact keys:
-        {
-            "summary": "",
-            "key_concepts": [],
-            "prerequisites": [],
-            "target_audience": ""
-        }
-        """
-        
         try:
-            book_content = f"""
-        Title: {book.title}
-        Author: {book.author}
-            Technical Level: {book.technical_level}
-            Topics: {', '.join(book.topics)}
-        Description: {book.description}
-        """
-        
-        response = ollama.chat(model=self.model_name, messages=[
-            {
-                'role': 'system',
-                'content': system_prompt
-            },
-            {
-                'role': 'user',
+            book_content = SUMMARY_BOOK_TEMPLATE.format(
+                title=book.title,
+                author=book.author,
+                technical_level=book.technical_level,
+                topics=", ".join(book.topics),
+                description=book.description
+            )
+            
+            response = self.client.chat(model=self.model_name, messages=[
+                {
+                    'role': 'system',
+                    'content': SUMMARY_SYSTEM_PROMPT
+                },
+                {
+                    'role': 'user',
                     'content': book_content
                 }
-            ])
+            ], format="json", options=SUMMARY_OPTIONS)
             
-            # Parse the response as JSON
+            # Output is constrained to JSON by the server, so this parse only
+            # fails if the reply was cut off at the token limit
             result = json.loads(response['message']['content'])
             return result
         except Exception as e:
@@ -308,9 +626,10 @@ def add_test_book():
         with get_db() as db:
             db.execute("""
                 INSERT OR IGNORE INTO books (
-                    title, author, description, technical_level, 
+                    id, title, author, description, technical_level, 
                     page_count, publication_year
                 ) VALUES (
+                    ?,
                     'Python Deep Learning', 
                     'John Smith',
                     'A comprehensive guide to deep learning with Python, covering neural networks, TensorFlow, and PyTorch.',
@@ -318,7 +637,7 @@ def add_test_book():
                     400,
                     2023
                 )
-            """)
+            """, (generate_book_id('Python Deep Learning', 'John Smith'),))
             db.commit()
     except Exception as e:
         print(f"Error adding test book: {str(e)}")
@@ -328,7 +647,7 @@ def add_test_book():
 async def create_test_book():
     """Add a test book to the database."""
     try:
-        add_test_book()
+        await asyncio.to_thread(add_test_book)
         return {"message": "Test book added successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -342,69 +661,86 @@ class AddBookRequest(BaseModel):
     page_count: Optional[int] = None
     publication_year: Optional[int] = None
 
+def insert_book(book_data: AddBookRequest) -> dict:
+    """Insert a book unless it exists and return the stored row. Blocking."""
+    with get_db() as db:
+        # The case-insensitive title/author index turns duplicates into no-ops
+        db.execute("""
+            INSERT OR IGNORE INTO books (
+                id, title, author, description, technical_level, 
+                page_count, publication_year
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                generate_book_id(book_data.title, book_data.author),
+                book_data.title,
+                book_data.author,
+                book_data.description,
+                book_data.technical_level,
+                book_data.page_count,
+                book_data.publication_year
+            ))
+        db.commit()
+        
+        # Get the inserted book, or the one already stored
+        cursor = db.execute(
+            "SELECT * FROM books WHERE LOWER(title) = LOWER(?) AND LOWER(author) = LOWER(?)",
+            (book_data.title, book_data.author)
+        )
+        return book_row_to_dict(cursor.fetchone())
+
 @app.post("/add-book")
 async def add_book(book_data: AddBookRequest):
     """Add a new book to the database."""
     try:
-        with get_db() as db:
-            cursor = db.execute("""
-                INSERT INTO books (
-                    title, author, description, technical_level, 
-                    page_count, publication_year
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    book_data.title,
-                    book_data.author,
-                    book_data.description,
-                    book_data.technical_level,
-                    book_data.page_count,
-                    book_data.publication_year
-                ))
-            db.commit()
-            
-            # Get the inserted book
-            book_id = cursor.lastrowid
-            cursor = db.execute("SELECT * FROM books WHERE id = ?", (book_id,))
-            book = cursor.fetchone()
-            
-            return {"message": "Book added successfully", "book": convert_db_book_to_model(book)}
+        book = await asyncio.to_thread(insert_book, book_data)
+        return {"message": "Book added successfully", "book": book}
     except Exception as e:
         print(f"Error adding book: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def save_rating(rating_data: Rating):
+    """Store a rating, replacing an earlier rating for the book. Blocking."""
+    # Write through the shared WAL connection
+    with get_db_cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO ratings (book_id, rating, timestamp)
+            VALUES (?, ?, ?)
+            ON CONFLICT(book_id) DO UPDATE SET
+                rating = excluded.rating,
+                timestamp = excluded.timestamp
+        """, (rating_data.book_id, rating_data.rating, rating_data.timestamp))
+
 @app.post("/submit-rating")
 async def submit_rating(rating_data: Rating):
     """Submit a rating for a book."""
     try:
-        with get_db() as db:
-            db.execute("""
-                INSERT INTO ratings (book_id, rating, timestamp)
-                VALUES (?, ?, ?)
-            """, (rating_data.book_id, rating_data.rating, rating_data.timestamp))
-            db.commit()
-            return {"message": "Rating submitted successfully"}
+        await asyncio.to_thread(save_rating, rating_data)
+        return {"message": "Rating submitted successfully"}
     except Exception as e:
         print(f"Error submitting rating: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def fetch_ratings():
+    """Return every rating row. Blocking."""
+    with get_db() as db:
+        return db.execute("SELECT * FROM ratings").fetchall()
+
 @app.get("/ratings")
 async def get_ratings():
     """Get all ratings from the database."""
     try:
-        with get_db() as db:
-            cursor = db.execute("SELECT * FROM ratings")
-            ratings = cursor.fetchall()
-            return {
-                "ratings": [
-                    {
-                        "id": rating["id"],
-                        "book_id": str(rating["book_id"]),
-                        "rating": rating["rating"],
-                        "timestamp": rating["timestamp"]
-                    }
-                    for rating in ratings
-                ]
-            }
+        ratings = await asyncio.to_thread(fetch_ratings)
+        return {
+            "ratings": [
+                {
+                    "id": rating["id"],
+                    "book_id": str(rating["book_id"]),
+                    "rating": rating["rating"],
+                    "timestamp": rating["timestamp"]
+                }
+                for rating in ratings
+            ]
+        }
     except Exception as e:
         print(f"Error getting ratings: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -4,10 +4,16 @@ CREATE TABLE IF NOT EXISTS books (
     author TEXT NOT NULL,
     description TEXT,
     average_rating REAL DEFAULT 0,
+    -- Goodreads average from the import; average_rating falls back to it only
+    -- while the book has no local ratings
+    imported_rating REAL,
     topics TEXT,
+    topics_mask INTEGER,
     technical_level TEXT,
     publication_year INTEGER,
-    page_count INTEGER
+    page_count INTEGER,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS ratings (
@@ -18,6 +24,47 @@ CREATE TABLE IF NOT EXISTS ratings (
     FOREIGN KEY (book_id) REFERENCES books(id)
 );
 
+-- One rating per book; the unique index on ratings(book_id) is created by migrate_schema
+
+-- Keep books.average_rating in step with ratings through running totals.
+-- It is the plain local average; a book whose last local rating is removed
+-- goes back to its imported average, or 0
+CREATE TRIGGER IF NOT EXISTS trg_ratings_local_ai AFTER INSERT ON ratings
+BEGIN
+    UPDATE books
+    SET rating_sum = rating_sum + NEW.rating,
+        rating_count = rating_count + 1,
+        average_rating = (rating_sum + NEW.rating) * 1.0 / (rating_count + 1)
+    WHERE id = NEW.book_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ratings_local_au AFTER UPDATE OF book_id, rating ON ratings
+BEGIN
+    UPDATE books
+    SET rating_sum = rating_sum - OLD.rating,
+        rating_count = rating_count - 1,
+        average_rating = CASE WHEN rating_count > 1
+            THEN (rating_sum - OLD.rating) * 1.0 / (rating_count - 1)
+            ELSE COALESCE(imported_rating, 0) END
+    WHERE id = OLD.book_id;
+    UPDATE books
+    SET rating_sum = rating_sum + NEW.rating,
+        rating_count = rating_count + 1,
+        average_rating = (rating_sum + NEW.rating) * 1.0 / (rating_count + 1)
+    WHERE id = NEW.book_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ratings_local_ad AFTER DELETE ON ratings
+BEGIN
+    UPDATE books
+    SET rating_sum = rating_sum - OLD.rating,
+        rating_count = rating_count - 1,
+        average_rating = CASE WHEN rating_count > 1
+            THEN (rating_sum - OLD.rating) * 1.0 / (rating_count - 1)
+            ELSE COALESCE(imported_rating, 0) END
+    WHERE id = OLD.book_id;
+END;
+
 CREATE TABLE IF NOT EXISTS dismissed_books (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     book_id TEXT NOT NULL,
@@ -32,4 +79,18 @@ CREATE TABLE IF NOT EXISTS wishlist (
     added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     display_order INTEGER NOT NULL,
     FOREIGN KEY (book_id) REFERENCES books(id)
-); 
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS gemini_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    ts INTEGER NOT NULL
+);
+
+-- Unit-length book vectors used by main.py's similarity ranking, stored as
+-- int8 values that multiply back to float by scale
+CREATE TABLE IF NOT EXISTS book_embeddings (
+    book_id TEXT PRIMARY KEY,
+    scale REAL NOT NULL,
+    vec BLOB NOT NULL
+);
@@ -0,0 +1,179 @@
+import logging
+import threading
+from pathlib import Path
+
+import pytest
+
+import database
+from database import fetch_random_books
+
+# schema.sql as it was before running totals, imported averages and the unique indexes
+OLD_SCHEMA = """
+CREATE TABLE books (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    description TEXT,
+    average_rating REAL DEFAULT 0,
+    topics TEXT,
+    technical_level TEXT,
+    publication_year INTEGER,
+    page_count INTEGER
+);
+
+CREATE TABLE ratings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id TEXT NOT NULL,
+    rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (book_id) REFERENCES books(id)
+);
+"""
+
+def book_totals(db, book_id):
+    return tuple(db.execute(
+        "SELECT rating_sum, rating_count, average_rating FROM books WHERE id = ?", (book_id,)
+    ).fetchone())
+
+def index_names(db):
+    return {row['name'] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+def test_rating_insert_replaces_imported_average(db, add_book):
+    """A local rating becomes the average; the imported one is kept aside."""
+    add_book('b1', 'Dune', 'Frank Herbert', imported_rating=4.0)
+    assert book_totals(db, 'b1') == (0, 0, 4.0)
+
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b1', 5)")
+    assert book_totals(db, 'b1') == (5, 1, 5.0)
+    assert db.execute("SELECT imported_rating FROM books WHERE id = 'b1'").fetchone()[0] == 4.0
+
+def test_rating_update_recomputes_average(db, add_book):
+    add_book('b1', 'Dune', 'Frank Herbert', imported_rating=4.0)
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b1', 5)")
+
+    db.execute("UPDATE ratings SET rating = 1 WHERE book_id = 'b1'")
+    assert book_totals(db, 'b1') == (1, 1, 1.0)
+
+def test_rating_moved_to_another_book(db, add_book):
+    """Changing book_id takes the rating off one book and onto the other."""
+    add_book('b1', 'Dune', 'Frank Herbert', imported_rating=4.0)
+    add_book('b2', 'Dune Messiah', 'Frank Herbert')
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b1', 3)")
+
+    db.execute("UPDATE ratings SET book_id = 'b2' WHERE book_id = 'b1'")
+    assert book_totals(db, 'b1') == (0, 0, 4.0)
+    assert book_totals(db, 'b2') == (3, 1, 3.0)
+
+def test_rating_delete_restores_imported_average(db, add_book):
+    add_book('b1', 'Dune', 'Frank Herbert', imported_rating=4.0)
+    add_book('b2', 'Dune Messiah', 'Frank Herbert')
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b1', 5)")
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b2', 2)")
+
+    db.execute("DELETE FROM ratings")
+    assert book_totals(db, 'b1') == (0, 0, 4.0)
+    assert book_totals(db, 'b2') == (0, 0, 0)
+
+def test_rating_delete_keeps_remaining_ratings_average(db, add_book):
+    """With several ratings on a book, removing one averages the rest."""
+    add_book('b1', 'Dune', 'Frank Herbert', imported_rating=4.0)
+    # Ratings are one per book since the unique index; older data may hold more
+    db.execute("DROP INDEX idx_ratings_book_id_unique")
+    db.executemany("INSERT INTO ratings (book_id, rating) VALUES ('b1', ?)", [(5,), (2,), (2,)])
+    assert book_totals(db, 'b1') == (9, 3, 3.0)
+
+    db.execute("DELETE FROM ratings WHERE rating = 5")
+    assert book_totals(db, 'b1') == (4, 2, 2.0)
+
+@pytest.fixture
+def old_db(tmp_path, monkeypatch):
+    """Point database at a file created from the old schema; init_db is left to the test."""
+    path = tmp_path / 'books.db'
+    monkeypatch.setattr(database, 'DATABASE_URL', str(path))
+    monkeypatch.setattr(database, '_local', threading.local())
+    monkeypatch.setattr(database, '_initialized', False)
+    monkeypatch.chdir(Path(__file__).parent)
+    conn = database.connect_db()
+    conn.executescript(OLD_SCHEMA)
+    yield conn
+    conn.close()
+    database.get_db().close()
+
+def test_migrate_schema_upgrades_old_database(old_db):
+    old_db.executemany("INSERT INTO books (id, title, author, average_rating) VALUES (?, ?, ?, ?)", [
+        ('b1', 'Dune', 'Frank Herbert', 4.2),
+        ('b2', 'Neuromancer', 'William Gibson', 0),
+    ])
+    # b2 was rated twice before ratings were one per book; the later one wins
+    old_db.executemany("INSERT INTO ratings (book_id, rating) VALUES (?, ?)", [('b2', 3), ('b2', 5)])
+    old_db.commit()
+
+    database.init_db()
+    db = database.get_db()
+
+    columns = {row['name'] for row in db.execute("PRAGMA table_info(books)")}
+    assert {'topics_mask', 'imported_rating', 'rating_sum', 'rating_count'} <= columns
+    assert db.execute("SELECT imported_rating FROM books WHERE id = 'b1'").fetchone()[0] == 4.2
+    assert db.execute("SELECT imported_rating FROM books WHERE id = 'b2'").fetchone()[0] is None
+    assert book_totals(db, 'b1') == (0, 0, 4.2)
+    assert book_totals(db, 'b2') == (5, 1, 5.0)
+    assert [row['rating'] for row in db.execute("SELECT rating FROM ratings")] == [5]
+
+    assert {
+        'idx_ratings_book_id_unique', 'idx_books_average_rating',
+        'idx_books_title_author', 'idx_books_title_author_nocase',
+    } <= index_names(db)
+    embedding_columns = {row['name'] for row in db.execute("PRAGMA table_info(book_embeddings)")}
+    assert embedding_columns == {'book_id', 'scale', 'vec'}
+
+    # Triggers created before the migration added their columns work afterwards
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b1', 2)")
+    assert book_totals(db, 'b1') == (2, 1, 2.0)
+
+def test_migrate_schema_falls_back_on_duplicate_books(old_db, caplog):
+    """Legacy duplicates get a plain title/author index and no case-insensitive one."""
+    old_db.executemany("INSERT INTO books (id, title, author) VALUES (?, ?, ?)", [
+        ('b1', 'Dune', 'Frank Herbert'),
+        ('b2', 'Dune', 'Frank Herbert'),
+        ('b3', 'Neuromancer', 'William Gibson'),
+        ('b4', 'NEUROMANCER', 'William Gibson'),
+    ])
+    old_db.commit()
+
+    with caplog.at_level(logging.WARNING, logger="liberopus"):
+        database.init_db()
+
+    indexes = index_names(database.get_db())
+    assert 'idx_books_title_author_dup' in indexes
+    assert 'idx_books_title_author' not in indexes
+    assert 'idx_books_title_author_nocase' not in indexes
+    assert len(caplog.records) == 2
+
+def test_migrate_schema_is_idempotent(db, add_book):
+    add_book('b1', 'Dune', 'Frank Herbert', imported_rating=4.0)
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b1', 5)")
+
+    database.migrate_schema(db)
+    assert book_totals(db, 'b1') == (5, 1, 5.0)
+
+def test_fetch_random_books_empty_table(db):
+    assert fetch_random_books(db) == []
+
+def test_fetch_random_books_sparse_table(db, add_book):
+    """Few rows left among many deleted rowids still fill the sample."""
+    for i in range(200):
+        add_book(f'b{i:03}', f'Book {i}', 'Author')
+    db.execute("DELETE FROM books WHERE id NOT IN ('b007', 'b101', 'b150', 'b180', 'b199', 'b042')")
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b101', 4)")
+
+    for _ in range(20):
+        books = fetch_random_books(db, limit=5)
+        ids = [book['id'] for book in books]
+        assert len(ids) == 5
+        assert len(set(ids)) == 5
+        assert set(ids) <= {'b007', 'b101', 'b150', 'b180', 'b199', 'b042'}
+
+    books = {book['id']: book for book in fetch_random_books(db, limit=10)}
+    assert len(books) == 6
+    assert books['b101']['average_rating'] == 4
+    assert books['b007']['average_rating'] == 0
@@ -0,0 +1,70 @@
+from main import DUPLICATE_BOOKS_SQL, find_fuzzy_duplicates, merge_duplicate_books
+
+def book(book_id, title, author):
+    return {'id': book_id, 'title': title, 'author': author}
+
+def test_merge_duplicate_books_keeps_lowest_id(db, add_book):
+    """Copies differing in case or surrounding spaces fold into the lowest id."""
+    add_book('b1', 'Dune', 'Frank Herbert', imported_rating=4.0)
+    add_book('b2', ' Dune ', 'Frank Herbert')
+    add_book('b3', 'Dune Messiah', 'Frank Herbert')
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b2', 5)")
+
+    assert merge_duplicate_books(db, DUPLICATE_BOOKS_SQL) == 1
+
+    assert [row['id'] for row in db.execute("SELECT id FROM books ORDER BY id")] == ['b1', 'b3']
+    # The duplicate's rating moved over and the triggers updated the kept copy
+    assert [tuple(row) for row in db.execute("SELECT book_id, rating FROM ratings")] == [('b1', 5)]
+    assert db.execute("SELECT average_rating FROM books WHERE id = 'b1'").fetchone()[0] == 5.0
+
+def test_merge_duplicate_books_drops_rating_when_both_rated(db, add_book):
+    """The kept copy's own rating wins over the duplicate's."""
+    add_book('b1', 'Dune', 'Frank Herbert')
+    add_book('b2', 'Dune ', 'Frank Herbert ')
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b1', 2)")
+    db.execute("INSERT INTO ratings (book_id, rating) VALUES ('b2', 5)")
+
+    assert merge_duplicate_books(db, DUPLICATE_BOOKS_SQL) == 1
+
+    assert [tuple(row) for row in db.execute("SELECT book_id, rating FROM ratings")] == [('b1', 2)]
+    assert db.execute("SELECT average_rating FROM books WHERE id = 'b1'").fetchone()[0] == 2.0
+
+def test_merge_duplicate_books_without_duplicates(db, add_book):
+    add_book('b1', 'Dune', 'Frank Herbert')
+    add_book('b2', 'Dune Messiah', 'Frank Herbert')
+
+    assert merge_duplicate_books(db, DUPLICATE_BOOKS_SQL) == 0
+    assert db.execute("SELECT COUNT(*) FROM books").fetchone()[0] == 2
+
+def test_fuzzy_duplicates_keep_sequels_apart():
+    books = [
+        book('b1', 'Dune', 'Frank Herbert'),
+        book('b2', 'Dune Messiah', 'Frank Herbert'),
+        book('b3', 'Dune', 'Frank  Herbert.'),
+    ]
+    assert find_fuzzy_duplicates(books, 90) == [('b3', 'b1')]
+
+def test_fuzzy_duplicates_merge_chains():
+    """b1 and b2 never match directly but join through b3."""
+    books = [
+        book('b1', 'The Pragmatic Programmer', 'Andrew Hunt'),
+        book('b2', 'Pragmatic Programmer', 'Andy Hunt'),
+        book('b3', 'The Pragmatic Programmer', 'Andy Hunt'),
+    ]
+    assert sorted(find_fuzzy_duplicates(books, 90)) == [('b2', 'b1'), ('b3', 'b1')]
+
+def test_fuzzy_duplicates_same_across_block_sizes():
+    """Pairs spanning blocks are found just as within one block."""
+    books = [
+        book('b1', 'The Pragmatic Programmer', 'Andrew Hunt'),
+        book('b2', 'Dune', 'Frank Herbert'),
+        book('b3', 'Neuromancer', 'William Gibson'),
+        book('b4', 'Pragmatic Programmer', 'Andy Hunt'),
+        book('b5', 'Dune Messiah', 'Frank Herbert'),
+        book('b6', 'The Pragmatic Programmer', 'Andy Hunt'),
+        book('b7', 'Neuromancer', 'Wiliam Gibson'),
+    ]
+    expected = sorted(find_fuzzy_duplicates(books, 90))
+    assert expected == [('b4', 'b1'), ('b6', 'b1'), ('b7', 'b3')]
+    for block_size in (1, 2, 3):
+        assert sorted(find_fuzzy_duplicates(books, 90, block_size=block_size)) == expected
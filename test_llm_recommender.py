@@ -0,0 +1,53 @@
+import orjson
+import pytest
+
+from app.llm_recommender import parse_streamed_json, split_book_history
+
+def rated(title, rating, topics=None):
+    return {'title': title, 'rating': rating, 'topics': topics}
+
+def test_parse_streamed_json_across_chunks():
+    chunks = ['[{"title": "Dune"}', ', {"title": "Neuromancer"}', ']']
+    assert parse_streamed_json(chunks) == [{'title': 'Dune'}, {'title': 'Neuromancer'}]
+
+def test_parse_streamed_json_stops_when_complete():
+    """Chunks after the reply parses are not read."""
+    def chunks():
+        yield '{"title": '
+        yield '"Dune"}\n'
+        raise AssertionError("stream read past the end of the JSON")
+    assert parse_streamed_json(chunks()) == {'title': 'Dune'}
+
+def test_parse_streamed_json_truncated_reply():
+    with pytest.raises(orjson.JSONDecodeError) as excinfo:
+        parse_streamed_json(['[{"title": "Dune"}', ', {"title": "Neu'])
+    assert excinfo.value.doc == '[{"title": "Dune"}, {"title": "Neu'
+
+def test_split_book_history_best_rated_group_first():
+    history = [
+        rated('Fluent Python', 3, ['Python']),
+        rated('SICP', 5, ['Lisp', 'Python']),
+        rated('Effective Python', 5, ['Python']),
+    ]
+    assert split_book_history(history) == [
+        [history[1]],
+        [history[0], history[2]],
+    ]
+
+def test_split_book_history_untagged_books():
+    history = [rated('Dune', 4), rated('Neuromancer', 4, [])]
+    assert split_book_history(history) == [history]
+
+def test_split_book_history_folds_extra_groups():
+    """Groups past max_groups join the last one so no rating is dropped."""
+    history = [
+        rated('Go', 2, ['Go']),
+        rated('Rust', 5, ['Rust']),
+        rated('C', 3, ['C']),
+        rated('Zig', 4, ['Zig']),
+    ]
+    groups = split_book_history(history, max_groups=2)
+    assert groups == [[history[1]], [history[3], history[2], history[0]]]
+
+def test_split_book_history_empty():
+    assert split_book_history([]) == []